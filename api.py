@@ -0,0 +1,139 @@
+import json
+from datetime import date
+from flask import Blueprint, request
+from models import app, Venue, Artist
+from city_calendar import city_calendar
+from queries import (SHOW_FIELDS, entity, entity_page, shows_page, decode_show_cursor,
+                     venue_timeline, artist_timeline)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# Versioned read API over the same query layer as the HTML pages. Every
+# endpoint takes ?fields= to select a subset of columns (the others are not
+# selected at all), list endpoints page with ?after=<cursor>&limit=, and
+# responses carry an ETag so clients can revalidate with If-None-Match.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+TIMELINE_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count', 'upcoming_shows_count')
+
+VENUE_FIELDS = [column.name for column in Venue.__table__.columns]
+ARTIST_FIELDS = [column.name for column in Artist.__table__.columns]
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+def json_response(payload, status=200):
+    response = app.response_class(dumps(payload), status=status, mimetype='application/json')
+    if status == 200:
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
+
+def requested_fields(allowed, default=None):
+    value = request.args.get('fields')
+    if not value:
+        return list(default or allowed)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def page_limit():
+    limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, app.config['API_PAGE_SIZE_MAX']))
+
+def _select(row, fields):
+    return {field: row[field] for field in fields}
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return json_response({"error": error.message}, error.status)
+
+#  Lists
+#  ----------------------------------------------------------------
+
+def _entity_list(model, allowed):
+    fields = requested_fields(allowed)
+    after = request.args.get('after')
+    if after is not None and not after.isdigit():
+        raise ApiError(400, 'Invalid cursor')
+    rows, next_cursor = entity_page(model, fields, int(after) if after else None, page_limit())
+    return json_response({"data": [_select(row, fields) for row in rows], "next": next_cursor})
+
+@api.route('/venues')
+def venues():
+    return _entity_list(Venue, VENUE_FIELDS)
+
+@api.route('/artists')
+def artists():
+    return _entity_list(Artist, ARTIST_FIELDS)
+
+@api.route('/shows')
+def shows():
+    fields = requested_fields(SHOW_FIELDS)
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_show_cursor(after)
+        except ValueError:
+            raise ApiError(400, 'Invalid cursor')
+    rows, next_cursor = shows_page(after or None, page_limit(), fields)
+    return json_response({"data": [_select(row, fields) for row in rows], "next": next_cursor})
+
+#  Details
+#  ----------------------------------------------------------------
+
+def _entity_detail(model, entity_id, allowed, timeline):
+    fields = requested_fields(allowed + list(TIMELINE_FIELDS), allowed)
+    columns = [field for field in fields if field not in TIMELINE_FIELDS]
+    data = entity(model, entity_id, columns or ['id'])
+    if data is None:
+        raise ApiError(404, 'Not found')
+    if len(columns) < len(fields):
+        data.update(timeline(entity_id, app.config['SHOWS_PER_SECTION']))
+    return json_response({"data": _select(data, fields)})
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return _entity_detail(Venue, venue_id, VENUE_FIELDS, venue_timeline)
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return _entity_detail(Artist, artist_id, ARTIST_FIELDS, artist_timeline)
+
+#  City calendar
+#  ----------------------------------------------------------------
+
+CALENDAR_FIELDS = ('day', 'show_count', 'shows')
+
+@api.route('/cities/<state>/<city>/calendar')
+def city_calendar_days(state, city):
+    fields = requested_fields(CALENDAR_FIELDS)
+    try:
+        start = date.fromisoformat(request.args['from']) if 'from' in request.args else date.today()
+    except ValueError:
+        raise ApiError(400, 'Invalid from date')
+    days = max(1, min(request.args.get('days', 7, type=int), app.config['CITY_CALENDAR_DAYS']))
+    calendar = city_calendar(state, city, start, days)
+    return json_response({"state": state, "city": city, "data": [_select(day, fields) for day in calendar]})
@@ -2,8 +2,10 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import dateutil.parser
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -12,6 +14,30 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import *
+from queries import (run, venues_listing_plan, artists_listing_plan, venue_page_plan, artist_page_plan,
+                     shows_page, decode_show_cursor, venues_validator, artists_validator, venue_validator,
+                     artist_validator, shows_validator)
+import bookings
+import city_calendar
+import counters
+import genres
+import images
+import search
+import typeahead
+import bulk_import
+import export
+from api import api
+from cache import page_cache
+from jobs import job_queue
+from conditional import conditional
+from pool_metrics import pool_stats
+from profiler import profiler
+from replicas import reads_replica
+from templating import template_stats
+# Imported for what they register on the app: the asset URL helpers, the
+# static file view and `flask assets`, and `flask plans`.
+import assets
+import query_plans
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -19,7 +45,64 @@ from models import *
 
 # TODO: connect to a local postgresql database
 
+def start_background_jobs():
+  if app.config['COUNTER_ROLL_INTERVAL']:
+    counters.start_roll_forward(app.config['COUNTER_ROLL_INTERVAL'])
 
+  if app.config['TYPEAHEAD_REBUILD_INTERVAL']:
+    typeahead.start_rebuild(app.config['TYPEAHEAD_REBUILD_INTERVAL'])
+
+  if app.config['CITY_CALENDAR_REFRESH_INTERVAL']:
+    city_calendar.start_refresh(app.config['CITY_CALENDAR_REFRESH_INTERVAL'])
+
+  if app.config['JOBS_WORKERS']:
+    job_queue.start(app.config['JOBS_WORKERS'])
+
+# Threads do not survive a fork: under gunicorn every worker starts its own
+# jobs from the post_fork hook (see gunicorn.conf.py).
+if not app.config['DEFER_BACKGROUND_JOBS']:
+  start_background_jobs()
+
+profiler.init_app(app)
+app.register_blueprint(api)
+
+@app.before_first_request
+def warm_typeahead():
+  typeahead.warmup()
+
+#  Jobs
+#  ----------------------------------------------------------------
+
+# Post-commit work that may run in any process (see jobs.py). Page cache
+# invalidation and search/typeahead indexing stay in the handlers: the LRU
+# cache and the in-process indexes belong to the process serving the
+# request, and doing them before the response leaves no stale window.
+
+@job_queue.job('fetch_image')
+def fetch_image_job(link):
+  images.refresh_thumbnail(link)
+
+def stream_template(template_name, **context):
+  # Renders a template chunk by chunk so the first bytes go out before the
+  # whole page is built.
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return template.generate(context)
+
+def format_show_times(shows, format='full'):
+  # Replaces each show's start_time with its display string in one batch.
+  start_times = format_datetimes([show['start_time'] for show in shows], format)
+  for show, start_time in zip(shows, start_times):
+    show['start_time'] = start_time
+  return shows
+
+def typeahead_response(index):
+  typeahead.warmup()
+  limit = min(request.args.get('limit', 10, type=int), 50)
+  response = jsonify(data=index.search(request.args.get('q', ''), limit))
+  response.cache_control.public = True
+  response.cache_control.max_age = app.config['TYPEAHEAD_MAX_AGE']
+  return response
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -34,106 +117,42 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(venues_validator)
+@page_cache.cached('venues')
 def venues():
-
-  # TODO: replace with real venues data.
-  #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-  data = []
-
-  get_result = Venue.query.distinct(Venue.city, Venue.state).all()
-  for item in get_result:
-    location = {
-      "city": item.city,
-      "state": item.state
-    }
-
-    venues = Venue.query.filter_by(city=item.city, state=item.state).all()
-
-    changed_venues=[]
-
-    for result in venues:
-      
-      changed_venues.append({
-        "id": result.id,
-        "name": result.name,
-        "num_upcoming_shows": result.num_upcoming_shows
-      })
-
-    location['venues'] = changed_venues
-    data.append(location)
-
-  
-  return render_template('pages/venues.html', areas=data);
+  genre = request.args.get('genre')
+  data = run(venues_listing_plan(genre))
+  return render_template('pages/venues.html', genre=genre, **data)
 
 @app.route('/venues/search', methods=['POST'])
+@reads_replica
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
   search_term = request.form.get("search_term", "")
-  response={}
-
-  venues = list(Venue.query.filter(
-    Venue.name.ilike(f"%{search_term}%") |
-    Venue.state.ilike(f"%{search_term}%") |
-    Venue.city.ilike(f"%{search_term}%")
-  ).all())
-
-  response['count'] = len(venues)
-  response['data'] = []
-
-  for venue in venues:
-    block = {
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": venue.num_upcoming_shows
-    }
-
-    response['data'].append(block)
+  venues = search.venues(search_term)
+  response = {
+    "count": len(venues),
+    "data": venues
+  }
 
-  
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
+@app.route('/venues/autocomplete')
+def autocomplete_venues():
+  return typeahead_response(typeahead.venue_index)
+
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_validator)
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  venue = Venue.query.get(venue_id)
-  past_shows = []
-  upcoming_shows = []
-  today_date = datetime.now()
-  shows = venue.show
-
-  for show in shows:
-    info = { 
-      "artist_id" : show.artist_id,
-      "artist_name": show.artists.name,
-      "artist_image_link": show.artists.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    }
-    if (show.start_time > today_date):
-      upcoming_shows.append(info)
-    else:
-      past_shows.append(info)
-
-  data ={
-    "id": venue.id,
-    "name": venue.name,
-    "genres": venue.genres.split(','),
-    "address": venue.address,
-    "city": venue.city,
-    "state": venue.state,
-    "phone": venue.phone,
-    "website_link": venue.website_link,
-    "facebook_link": venue.facebook_link,
-    "seeking_talent": venue.seeking_talent,
-    "seeking_description": venue.seeking_description,
-    "image_link": venue.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
+  data = run(venue_page_plan(venue_id, app.config['SHOWS_PER_SECTION']))
+  if data is None:
+    abort(404)
+  page_cache.depends_on(*(f"artist:{show['artist_id']}" for show in data['upcoming_shows'] + data['past_shows']))
+  format_show_times(data['upcoming_shows'] + data['past_shows'])
 
   return render_template('pages/show_venue.html', venue=data)
 
@@ -160,7 +179,7 @@ def create_venue_submission():
   new_venue.state = request.form['state']
   new_venue.address = request.form['address']
   new_venue.phone = request.form['phone']
-  new_venue.genres = request.form['genres']
+  genres.set_venue_genres(new_venue, request.form.getlist('genres'))
   new_venue.image_link = request.form['image_link']
   new_venue.facebook_link = request.form['facebook_link']
   new_venue.website_link = request.form['website_link']
@@ -170,6 +189,10 @@ def create_venue_submission():
   try:
     db.session.add(new_venue)
     db.session.commit()
+    search.index_venue(new_venue)
+    typeahead.index_venue(new_venue)
+    page_cache.invalidate('venues')
+    images.request_thumbnail(new_venue.image_link)
 
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -188,10 +211,17 @@ def create_venue_submission():
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  venue_id = request.form.get('venue_id')
+  venue_id = request.form.get('venue_id', venue_id)
   try:
+    city_calendar.mark_venue_city(venue_id)
+    counters.shows_removed(Show.venue_id == venue_id)
+    Show.query.filter_by(venue_id=venue_id).delete()
+    genres.venue_removed(venue_id)
     Venue.query.filter_by(id=venue_id).delete()
     db.session.commit()
+    search.unindex_venue(venue_id)
+    typeahead.unindex_venue(venue_id)
+    page_cache.invalidate('venues', f'venue:{venue_id}')
     flash('Venue was successfully deleted!')
   except:
     db.session.rollback()
@@ -205,87 +235,47 @@ def delete_venue(venue_id):
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  return redirect(url_for('index'))
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(artists_validator)
+@page_cache.cached('artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[]
-  artists = Artist.query.distinct(Artist.id, Artist.name).all()
-  for artist in artists:
-    info={
-      "id": artist.id,
-      "name": artist.name
-    }
-    data.append(info)
-
-  
-  return render_template('pages/artists.html', artists=data)
+  genre = request.args.get('genre')
+  data = run(artists_listing_plan(genre))
+  return render_template('pages/artists.html', genre=genre, **data)
 
 @app.route('/artists/search', methods=['POST'])
+@reads_replica
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
   search_term = request.form.get("search_term", "")
-  response = {}
-
-  artists = list(Artist.query.filter(
-    Artist.name.ilike(f"%{search_term}%")).all())
-
-  response["count"] = len(artists)
-  response["data"] = []
-
-  for artist in artists:
-    info = {
-    "id": artist.id,
-    "name": artist.name,
-    "num_upcoming_shows": artist.num_upcoming_shows
-    }
-    response["data"].append(info) 
+  artists = search.artists(search_term)
+  response = {
+    "count": len(artists),
+    "data": artists
+  }
   
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
+@app.route('/artists/autocomplete')
+def autocomplete_artists():
+  return typeahead_response(typeahead.artist_index)
+
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_validator)
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  artist = Artist.query.get(artist_id)
-  shows = artist.show
-  past_shows=[]
-  upcoming_shows = []
-  today_date = datetime.now()
-  for show in shows:
-    info={
-      "venue_id": show.id,
-      "venue_name": show.venues.name,
-      "venue_image_link": show.venues.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    }
-    if (show.start_time > today_date):
-      upcoming_shows.append(info)
-    else:
-      past_shows.append(info)
-
-  data ={
-    "id": artist.id,
-    "name": artist.name,
-    "city": artist.city,
-    "state": artist.state,
-    "phone": artist.phone,
-    "genres": artist.genres.split(','),
-    "facebook_link": artist.facebook_link,
-    "website_link": artist.website_link,
-    "image_link": artist.image_link,
-    "seeking_venue": artist.seeking_venue,
-    "seeking_description": artist.seeking_description,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
-  }
+  data = run(artist_page_plan(artist_id, app.config['SHOWS_PER_SECTION']))
+  if data is None:
+    abort(404)
+  page_cache.depends_on(*(f"venue:{show['venue_id']}" for show in data['upcoming_shows'] + data['past_shows']))
+  format_show_times(data['upcoming_shows'] + data['past_shows'])
   
   return render_template('pages/show_artist.html', artist=data)
 
@@ -325,7 +315,7 @@ def edit_artist_submission(artist_id):
   artist.city = request.form['city']
   artist.state = request.form['state']
   artist.phone = request.form['phone']
-  artist.genres = request.form['genres']
+  genres.set_artist_genres(artist, request.form.getlist('genres'))
   artist.facebook_link = request.form['facebook_link']
   artist.website_link = request.form['website_link']
   artist.image_link = request.form['image_link']
@@ -334,6 +324,10 @@ def edit_artist_submission(artist_id):
 
   try:
     db.session.commit()
+    search.index_artist(artist)
+    typeahead.index_artist(artist)
+    page_cache.invalidate('artists', f'artist:{artist_id}')
+    images.request_thumbnail(artist.image_link)
     flash('Artist ' + request.form['name'] + ' has been successfully edited')
   except:
     print(sys.exc_info())
@@ -374,12 +368,14 @@ def edit_venue_submission(venue_id):
     check = True
   
   venue = Venue.query.get(venue_id)
+  if (venue.city, venue.state) != (request.form['city'], request.form['state']):
+    city_calendar.mark_venue_city(venue_id)
   venue.name = request.form['name']
   venue.city = request.form['city']
   venue.state = request.form['state']
   venue.address = request.form['address']
   venue.phone = request.form['phone']
-  venue.genres = request.form['genres']
+  genres.set_venue_genres(venue, request.form.getlist('genres'))
   venue.facebook_link = request.form['facebook_link']
   venue.website_link = request.form['website_link']
   venue.image_link = request.form['image_link']
@@ -387,6 +383,10 @@ def edit_venue_submission(venue_id):
   venue.seeking_description = request.form['seeking_description']
   try:
     db.session.commit()
+    search.index_venue(venue)
+    typeahead.index_venue(venue)
+    page_cache.invalidate('venues', f'venue:{venue_id}')
+    images.request_thumbnail(venue.image_link)
     flash('Venue ' + request.form['name'] + ' has been successfully edited')
   except:
     print(sys.exc_info())
@@ -416,7 +416,7 @@ def create_artist_submission():
   new_artist.city = request.form['city']
   new_artist.state = request.form['state']
   new_artist.phone = request.form['phone']
-  new_artist.genres = request.form['genres']
+  genres.set_artist_genres(new_artist, request.form.getlist('genres'))
   new_artist.image_link = request.form['image_link']
   new_artist.facebook_link = request.form['facebook_link']
   new_artist.website_link = request.form['website_link']
@@ -425,6 +425,10 @@ def create_artist_submission():
   try:
     db.session.add(new_artist)
     db.session.commit()
+    search.index_artist(new_artist)
+    typeahead.index_artist(new_artist)
+    page_cache.invalidate('artists')
+    images.request_thumbnail(new_artist.image_link)
     # on successful db insert, flash success
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
     # TODO: on unsuccessful db insert, flash an error instead.
@@ -443,23 +447,31 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_validator)
+@page_cache.cached('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  data=[]
-  shows = Show.query.all()
-  for show in shows:
-    info={
-      "venue_id": show.venue_id,
-      "venue_name": show.venues.name,
-      "artist_id": show.artist_id,
-      "artist_name": show.artists.name,
-      "artist_image_link": show.artists.image_link,
-      "start_time": str(show.start_time)
-    }
-    data.append(info)
-  
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one keyset page at a time
+  after = request.args.get('after')
+  if after:
+    try:
+      after = decode_show_cursor(after)
+    except ValueError:
+      abort(400)
+  limit = min(request.args.get('limit', app.config['SHOWS_PAGE_SIZE'], type=int),
+              app.config['SHOWS_PAGE_SIZE_MAX'])
+
+  data, next_cursor = shows_page(after=after or None, limit=max(limit, 1))
+  page_cache.depends_on(*(f"venue:{show['venue_id']}" for show in data))
+  page_cache.depends_on(*(f"artist:{show['artist_id']}" for show in data))
+  format_show_times(data)
+
+  stream = request.args.get('stream', type=int)
+  if stream is None:
+    stream = app.config['SHOWS_STREAM']
+  if stream:
+    return Response(stream_with_context(
+      stream_template('pages/shows.html', shows=data, next_cursor=next_cursor, limit=limit)))
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor, limit=limit)
 
 @app.route('/shows/create')
 def create_shows():
@@ -471,21 +483,35 @@ def create_shows():
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
+  form = ShowForm()
+  if not form.duration.validate(form):
+    flash(f"Show could not be listed. Duration: {' '.join(form.duration.errors)}")
+    return render_template('pages/home.html')
   try:
     new_shows = Show()
     new_shows.artist_id = request.form['artist_id']
     new_shows.venue_id = request.form['venue_id']
-    new_shows.start_time = str(request.form['start_time'])
+    new_shows.start_time = dateutil.parser.parse(request.form['start_time'])
+    new_shows.duration = form.duration.data or DEFAULT_SHOW_DURATION
+    bookings.check(new_shows)
 
     db.session.add(new_shows)
+    counters.show_added(new_shows)
     db.session.commit()
+    page_cache.invalidate('shows', 'venues', f'venue:{new_shows.venue_id}', f'artist:{new_shows.artist_id}')
     # on successful db insert, flash success
     flash('Show was successfully listed!')
 
+  except bookings.BookingConflict as conflict:
+    db.session.rollback()
+    flash(f'Show could not be listed. {conflict}')
   except:
     print(sys.exc_info())
     db.session.rollback()
-    flash('An error occurred. Show could not be listed.')
+    if bookings.is_conflict_error(sys.exc_info()[1]):
+      flash('Show could not be listed. The venue or the artist is already booked at that time.')
+    else:
+      flash('An error occurred. Show could not be listed.')
     # TODO: on unsuccessful db insert, flash an error instead.
     # e.g., flash('An error occurred. Show could not be listed.')
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
@@ -493,6 +519,76 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
+#  Import
+#  ----------------------------------------------------------------
+
+@app.route('/import', methods=['POST'])
+def bulk_import_submission():
+  # accepts 'venues', 'artists' and 'shows' file uploads (CSV or JSONL)
+  if not bulk_import.authorized(request.headers.get('Authorization')):
+    abort(403)
+  sources = bulk_import.upload_sources(request.files, request.form.get('format'))
+  return jsonify(bulk_import.import_catalog(sources))
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<kind>.<format>')
+def export_table(kind, format):
+  if kind not in export.MODELS or format not in export.FORMATS:
+    abort(404)
+  table = export.Export(
+    kind,
+    start=request.args.get('start', type=dateutil.parser.parse),
+    end=request.args.get('end', type=dateutil.parser.parse),
+    since=request.args.get('since', type=dateutil.parser.parse)
+  )
+  response = Response(stream_with_context(table.write(format, app.config['EXPORT_CHUNK_SIZE'])),
+                      mimetype=export.FORMATS[format])
+  if table.watermark is not None:
+    response.headers['X-Export-Watermark'] = table.watermark.isoformat()
+  return response
+
+#  Images
+#  ----------------------------------------------------------------
+
+@app.route('/images/<kind>/<int:entity_id>.jpg')
+def image_thumbnail(kind, entity_id):
+  if kind not in images.OWNERS or not images.enabled():
+    abort(404)
+  return images.thumbnail_response(kind, entity_id, request.args.get('v'))
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics/images')
+def image_metrics():
+  if not images.enabled():
+    abort(404)
+  return jsonify(images.thumbnail_cache.stats())
+
+@app.route('/metrics/cache')
+def cache_metrics():
+  return jsonify(page_cache.stats())
+
+@app.route('/metrics/pool')
+def connection_pool_metrics():
+  return jsonify(pool_stats.snapshot())
+
+@app.route('/metrics/jobs')
+def job_metrics():
+  return jsonify(job_queue.stats())
+
+@app.route('/metrics/templates')
+def template_metrics():
+  return jsonify(template_stats.snapshot())
+
+@app.route('/debug/queries')
+def debug_queries():
+  if not profiler.enabled:
+    abort(404)
+  return jsonify(requests=profiler.reports())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -516,13 +612,7 @@ if not app.debug:
 # Launch.
 #----------------------------------------------------------------------------#
 
-# Default port:
-if __name__ == '__main__':
-    app.run()
-
-# Or specify port manually:
-'''
+# Development server; production runs under gunicorn (see gunicorn.conf.py).
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
-'''
+    app.run(port=port)
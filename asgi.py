@@ -0,0 +1,293 @@
+import asyncio
+import io
+import sys
+from contextlib import asynccontextmanager
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, render_template, session
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.exceptions import HTTPException
+from app import app, db, format_show_times
+import search
+from cache import page_cache
+from replicas import sticky_to_primary
+from conditional import validators, not_modified, set_validators
+from templating import compile_templates
+from queries import (decode_show_cursor, venues_listing_plan, artists_listing_plan, venue_page_plan,
+                     artist_page_plan, shows_page_plan, venues_validator, artists_validator,
+                     venue_validator, artist_validator, shows_validator)
+
+#----------------------------------------------------------------------------#
+# ASGI application.
+#----------------------------------------------------------------------------#
+
+# `uvicorn asgi:application` serves the read pages on an asyncio event loop.
+# Their query plans (see queries.py) go through an async engine, every
+# query of a page on its own connection and all of them concurrently, so a
+# slow query holds a connection but no thread. Validators, the page cache
+# and the templates are the ones app.py uses. Building the query plans
+# (which may build the search indexes), page cache I/O and rendering still
+# block, so they run on the loop's thread pool, each call with its own
+# db.session, removed when it returns. Any other route, and any page
+# carrying flashed messages, is handed to the Flask app through asgiref's
+# WSGI adapter, which runs it on a thread pool.
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_database_url(config):
+    # Pages only read, so a replica is used when there is one.
+    if config['ASYNC_DATABASE_URL']:
+        return config['ASYNC_DATABASE_URL']
+    url = make_url((config['SQLALCHEMY_REPLICA_URIS'] or [config['SQLALCHEMY_DATABASE_URI']])[0])
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def _engine_options(config):
+    # Same pool settings as the sync engine, on an asyncio-aware pool.
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    options['poolclass'] = AsyncAdaptedQueuePool
+    return options
+
+engine = create_async_engine(async_database_url(app.config), **_engine_options(app.config))
+# Pages read from a replica are cached for REPLICA_CACHE_TTL seconds only.
+READS_REPLICA = not app.config['ASYNC_DATABASE_URL'] and bool(app.config['SQLALCHEMY_REPLICA_URIS'])
+wsgi_application = WsgiToAsgi(app)
+compile_templates()
+
+async def _fetch(query):
+    async with engine.connect() as connection:
+        return (await connection.execute(query.statement)).all()
+
+async def blocking(function, *args, **kwargs):
+    def call():
+        try:
+            with app.app_context():
+                return function(*args, **kwargs)
+        finally:
+            db.session.remove()
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+async def run(build_plan, *args, **kwargs):
+    queries, finish = await blocking(build_plan, *args, **kwargs)
+    return finish(*await asyncio.gather(*(_fetch(query) for query in queries)))
+
+def _render_page(request, tags, template_name, **context):
+    with app.request_context(request.environ):
+        g.read_replica = READS_REPLICA
+        if tags is not None:
+            g.cache_tags = tags
+        return app.response_class(render_template(template_name, **context)), tags
+
+async def _render(request, tags, template_name, **context):
+    # The page and its cache tags. Cached fragments of the page take the
+    # same tags, as under @page_cache.cached.
+    return await blocking(_render_page, request, tags, template_name, **context)
+
+#  Pages
+#  ----------------------------------------------------------------
+
+# Each page returns (response, cache tags), or None to leave the request
+# to the Flask app (missing rows, bad arguments). Tags of None mark pages
+# that are never cached.
+
+async def venues(request):
+    genre = request.args.get('genre')
+    data = await run(venues_listing_plan, genre)
+    return await _render(request, {'venues'}, 'pages/venues.html', genre=genre, **data)
+
+async def artists(request):
+    genre = request.args.get('genre')
+    data = await run(artists_listing_plan, genre)
+    return await _render(request, {'artists'}, 'pages/artists.html', genre=genre, **data)
+
+async def show_venue(request, venue_id):
+    data = await run(venue_page_plan, venue_id, app.config['SHOWS_PER_SECTION'])
+    if data is None:
+        return None
+    shows = data['upcoming_shows'] + data['past_shows']
+    tags = {f'venue:{venue_id}'} | {f"artist:{show['artist_id']}" for show in shows}
+    format_show_times(shows)
+    return await _render(request, tags, 'pages/show_venue.html', venue=data)
+
+async def show_artist(request, artist_id):
+    data = await run(artist_page_plan, artist_id, app.config['SHOWS_PER_SECTION'])
+    if data is None:
+        return None
+    shows = data['upcoming_shows'] + data['past_shows']
+    tags = {f'artist:{artist_id}'} | {f"venue:{show['venue_id']}" for show in shows}
+    format_show_times(shows)
+    return await _render(request, tags, 'pages/show_artist.html', artist=data)
+
+async def shows(request):
+    after = request.args.get('after')
+    if after:
+        try:
+            after = decode_show_cursor(after)
+        except ValueError:
+            return None
+    limit = min(request.args.get('limit', app.config['SHOWS_PAGE_SIZE'], type=int),
+                app.config['SHOWS_PAGE_SIZE_MAX'])
+
+    data, next_cursor = await run(shows_page_plan, after=after or None, limit=max(limit, 1))
+    tags = {'shows'} | {f"venue:{show['venue_id']}" for show in data} \
+        | {f"artist:{show['artist_id']}" for show in data}
+    format_show_times(data)
+    return await _render(request, tags, 'pages/shows.html', shows=data, next_cursor=next_cursor, limit=limit)
+
+async def search_venues(request):
+    search_term = request.form.get('search_term', '')
+    venues = await run(search.venues_plan, search_term)
+    results = {"count": len(venues), "data": venues}
+    return await _render(request, None, 'pages/search_venues.html', results=results, search_term=search_term)
+
+async def search_artists(request):
+    search_term = request.form.get('search_term', '')
+    artists = await run(search.artists_plan, search_term)
+    results = {"count": len(artists), "data": artists}
+    return await _render(request, None, 'pages/search_artists.html', results=results, search_term=search_term)
+
+# Flask endpoint -> (page, validator plan or None)
+PAGES = {
+    'venues': (venues, venues_validator),
+    'artists': (artists, artists_validator),
+    'show_venue': (show_venue, venue_validator),
+    'show_artist': (show_artist, artist_validator),
+    'shows': (shows, shows_validator),
+    'search_venues': (search_venues, None),
+    'search_artists': (search_artists, None),
+}
+
+#  Dispatch
+#  ----------------------------------------------------------------
+
+def _environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': scope.get('server', ('localhost', 80))[0],
+        'SERVER_PORT': str(scope.get('server', ('localhost', 80))[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+async def _dispatch(environ):
+    # Mirrors @conditional and @page_cache.cached around the view in app.py.
+    if environ['REQUEST_METHOD'] not in ('GET', 'POST'):
+        return None
+    try:
+        endpoint, values = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    if endpoint not in PAGES:
+        return None
+
+    request = app.request_class(environ)
+    with app.request_context(environ):
+        # Pages carrying flashed messages belong to a single visitor, who
+        # may also have to read from the primary after a write.
+        if session.get('_flashes') or (app.config['SQLALCHEMY_REPLICA_URIS'] and sticky_to_primary()):
+            return None
+    page, validator = PAGES[endpoint]
+
+    validated = await run(validator, **values) if validator is not None else None
+    etag = None
+    if validated is not None:
+        etag, last_modified = validators(validated)
+        if not_modified(environ, etag, last_modified):
+            return set_validators(app.response_class(status=304), etag, last_modified)
+
+    cached = validator is not None and page_cache.backend is not None
+    response = await blocking(page_cache.get, request.full_path, etag) if cached else None
+    if response is None:
+        result = await page(request, **values)
+        if result is None:
+            return None
+        response, tags = result
+        if cached:
+            ttl = app.config['REPLICA_CACHE_TTL'] if READS_REPLICA else None
+            await blocking(page_cache.set, request.full_path, response, tags, etag, ttl)
+            response.headers['X-Cache'] = 'MISS'
+    if validated is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+def _replay(body):
+    # A receive() that hands the already read body to the WSGI adapter.
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+    return receive
+
+async def _send(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()]
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+@asynccontextmanager
+async def lifespan():
+    # Servers run it through the ASGI lifespan protocol; clients driving
+    # `application` directly (httpx, the load test) wrap their requests in
+    # it. Disposing the engine closes its connections, whose driver threads
+    # (aiosqlite's) would otherwise keep the process from exiting.
+    try:
+        yield
+    finally:
+        await engine.dispose()
+
+async def _lifespan(receive, send):
+    async with lifespan():
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                break
+    await send({'type': 'lifespan.shutdown.complete'})
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    body = await _read_body(receive)
+    environ = _environ(scope, body)
+    try:
+        response = await _dispatch(environ)
+    except Exception:
+        app.logger.exception('Serving %s failed', scope['path'])
+        with app.request_context(environ):
+            response = app.response_class(render_template('errors/500.html'), status=500)
+    if response is None:
+        return await wsgi_application(scope, _replay(body), send)
+    await _send(send, response)
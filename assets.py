@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import click
+from flask import request, send_from_directory, url_for
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+from models import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask assets build` concatenates the files of each bundle into
+# static/dist/<bundle>.<hash>.<ext>, with gzip (and, when the brotli package
+# is installed, brotli) variants next to it, and records the names in
+# static/dist/manifest.json. Templates ask asset_urls() for a bundle's URLs:
+# the fingerprinted bundle when ASSETS_BUNDLED is on and the manifest exists,
+# the source files otherwise. Fingerprinted files never change under their
+# URL, so they are served as immutable for a year; a ?v= that is not the
+# file's current hash gets the ordinary static caching.
+
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/font-awesome.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # Loaded in <head>, before the page is parsed
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Deferred, in this order, at the end of <body>
+    'main.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+def _static_path(filename):
+    return os.path.join(app.static_folder, *filename.split('/'))
+
+def _manifest_path():
+    return _static_path('dist/manifest.json')
+
+def _load_manifest():
+    if not app.config['ASSETS_BUNDLED'] or not os.path.exists(_manifest_path()):
+        return None
+    with open(_manifest_path()) as manifest:
+        return json.load(manifest)
+
+_manifest = _load_manifest()
+_file_hashes = {}
+
+def file_hash(filename):
+    # Content hash of a static file, kept until the file's mtime changes;
+    # None when there is no such file.
+    path = _static_path(filename)
+    if not os.path.exists(path):
+        return None
+    mtime = os.stat(path).st_mtime
+    cached = _file_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as source:
+            cached = (mtime, hashlib.sha256(source.read()).hexdigest()[:12])
+        _file_hashes[filename] = cached
+    return cached[1]
+
+def static_url(filename):
+    # URL of a static file carrying its content hash, so it can be cached
+    # for good.
+    return url_for('static', filename=filename, v=file_hash(filename))
+
+def asset_urls(bundle):
+    if _manifest is not None and bundle in _manifest:
+        return [url_for('static', filename=_manifest[bundle])]
+    return [static_url(filename) for filename in BUNDLES[bundle]]
+
+app.jinja_env.globals.update(asset_urls=asset_urls, static_url=static_url)
+
+#  Build
+#  ----------------------------------------------------------------
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+def _rewrite_css_urls(css, filename):
+    # Bundles live in another directory than their sources: relative url()s
+    # are made absolute, and fingerprinted when the file exists.
+    def rewrite(match):
+        target = match.group(2).strip()
+        if target.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        path = re.match(r'[^?#]*', target).group(0)
+        suffix = target[len(path):]
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(filename), path))
+        url = f'{app.static_url_path}/{path}'
+        if os.path.exists(_static_path(path)):
+            fragment = suffix.partition('#')[2]
+            suffix = f'?v={file_hash(path)}' + (f'#{fragment}' if fragment else '')
+        return f'url("{url}{suffix}")'
+    return CSS_URL.sub(rewrite, css)
+
+def minify_css(css):
+    # Comments (except /*! license */ ones) and whitespace around
+    # punctuation go; strings and selectors are left alone.
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+def _source(filename):
+    with open(_static_path(filename), encoding='utf-8') as source:
+        return source.read()
+
+def bundle(name):
+    missing = [filename for filename in BUNDLES[name] if not os.path.exists(_static_path(filename))]
+    if missing:
+        raise click.ClickException(f"{name}: missing {', '.join(missing)}")
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(_rewrite_css_urls(_source(filename), filename))
+                         for filename in BUNDLES[name])
+    # Minified libraries may omit the final semicolon.
+    return '\n;\n'.join(_source(filename) for filename in BUNDLES[name])
+
+def _write(path, content):
+    with open(path, 'wb') as target:
+        target.write(content)
+
+def build():
+    global _manifest
+    os.makedirs(_static_path('dist'), exist_ok=True)
+    manifest = {}
+    for name in BUNDLES:
+        content = bundle(name).encode('utf-8')
+        stem, extension = os.path.splitext(name)
+        filename = f'dist/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+        _write(_static_path(filename), content)
+        _write(_static_path(filename) + '.gz', gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            _write(_static_path(filename) + '.br', brotli.compress(content))
+        manifest[name] = filename
+    _write(_manifest_path(), json.dumps(manifest, indent=2).encode('utf-8'))
+    if app.config['ASSETS_BUNDLED']:
+        _manifest = manifest
+    return manifest
+
+#  Serving
+#  ----------------------------------------------------------------
+
+def _precompressed(filename):
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.exists(_static_path(filename) + suffix):
+            return encoding, filename + suffix
+    return None, filename
+
+def _current_version(filename):
+    # Whether ?v= is the hash of the file as it is now; an old or made-up
+    # version must not be cached for good under that URL.
+    version = request.args.get('v')
+    return version is not None and safe_join(app.static_folder, filename) is not None and \
+        version == file_hash(filename)
+
+def static_file(filename):
+    # Replaces Flask's static view. Bundles and URLs carrying the file's
+    # content hash are sent as immutable, bundles in their precompressed
+    # variant when the client accepts it.
+    if not filename.startswith('dist/') and not _current_version(filename):
+        return app.send_static_file(filename)
+    encoding, path = _precompressed(filename)
+    response = send_from_directory(app.static_folder, path, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if filename.startswith('dist/'):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.expires = None
+    return response
+
+app.view_functions['static'] = static_file
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build static assets.')
+
+@assets_cli.command('build')
+def build_command():
+    """Write the fingerprinted, precompressed bundles and their manifest."""
+    for name, filename in build().items():
+        click.echo(f'{name} -> {filename} ({os.path.getsize(_static_path(filename))} bytes)')
+    if brotli is None:
+        click.echo('brotli is not installed: only gzip variants were written')
+
+app.cli.add_command(assets_cli)
@@ -0,0 +1,49 @@
+import argparse
+import time
+from benchmarks.common import configure, seed, timed
+
+configure('api')
+
+from app import app
+
+# Throughput of the JSON API against the HTML routes serving the same data:
+# each pair is requested REPEAT times in a row from one test client, with
+# the page cache off so that every request queries and renders.
+
+PAIRS = [
+    ('venue listing', '/venues', '/api/v1/venues'),
+    ('venue listing, id+name', '/venues', '/api/v1/venues?fields=id,name'),
+    ('venue page', '/venues/{id}', '/api/v1/venues/{id}?fields=id,name,city,state,past_shows,upcoming_shows'),
+    ('artist page', '/artists/{id}', '/api/v1/artists/{id}?fields=id,name,city,state,past_shows,upcoming_shows'),
+    ('shows', '/shows', '/api/v1/shows'),
+]
+
+def throughput(client, path, repeat):
+    def get():
+        assert client.get(path).status_code == 200, path
+    get()
+    started = time.perf_counter()
+    latency = timed(get, repeat)
+    return repeat / (time.perf_counter() - started), latency
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON API throughput against the HTML routes.')
+    parser.add_argument('--entities', type=int, default=1000, help='venues and artists')
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(venues=args.entities, artists=args.entities, shows=args.shows)
+    client = app.test_client()
+    client.get('/')  # builds the typeahead indexes
+    print(f"{'case':<24} {'html req/s':>11} {'html p99 ms':>12} {'api req/s':>10} {'api p99 ms':>11} {'speedup':>8}")
+    for name, html_path, api_path in PAIRS:
+        entity_id = args.entities // 2
+        html, html_latency = throughput(client, html_path.format(id=entity_id), args.repeat)
+        api, api_latency = throughput(client, api_path.format(id=entity_id), args.repeat)
+        print(f"{name:<24} {html:>11.1f} {html_latency['p99_ms']:>12} {api:>10.1f} "
+              f"{api_latency['p99_ms']:>11} {api / html:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import threading
+import time
+from benchmarks.common import configure, seed
+
+configure('asgi')
+
+import httpx
+from app import app
+from pool_metrics import latency_summary
+import asgi
+
+# Load test of the two serving modes in one process: CLIENTS threads
+# calling the Flask app (the sync WSGI mode), then CLIENTS concurrent tasks
+# calling asgi.application on one event loop, each for DURATION seconds,
+# requesting the read pages in turn. Reports requests per second and the
+# latency percentiles. Use a PostgreSQL BENCH_DATABASE_URL (with asyncpg
+# installed) for realistic numbers; the SQLite default goes through
+# aiosqlite's thread.
+
+PATHS = ['/venues', '/venues/{id}', '/artists/{id}', '/shows', '/artists']
+
+def path(request, entities):
+    return PATHS[request % len(PATHS)].format(id=request % entities + 1)
+
+def sync_load(clients, duration, entities):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(number):
+        test_client = app.test_client()
+        own = []
+        request = number
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = test_client.get(path(request, entities)).status_code
+            own.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+            request += clients
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+async def async_load(clients, duration, entities):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    transport = httpx.ASGITransport(app=asgi.application)
+
+    async with asgi.lifespan(), httpx.AsyncClient(transport=transport, base_url='http://localhost') as http:
+        async def client(number):
+            request = number
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                status = (await http.get(path(request, entities))).status_code
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append(status)
+                request += clients
+        await asyncio.gather(*(client(number) for number in range(clients)))
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync WSGI against ASGI serving: throughput and latency.')
+    parser.add_argument('--clients', default='1,8,32', help='comma-separated concurrent client counts')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--entities', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(venues=args.entities, artists=args.entities, shows=args.entities * 10)
+    app.test_client().get('/')  # builds the typeahead indexes
+    print(f"{'mode':<6} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for clients in (int(clients) for clients in args.clients.split(',')):
+        for mode, (latencies, errors) in (
+                ('sync', sync_load(clients, args.duration, args.entities)),
+                ('async', asyncio.run(async_load(clients, args.duration, args.entities)))):
+            summary = latency_summary(latencies)
+            print(f"{mode:<6} {clients:>8} {len(latencies) / args.duration:>9.1f} {summary['p50_ms']:>8} "
+                  f"{summary['p99_ms']:>8} {len(errors):>7}")
+
+if __name__ == '__main__':
+    main()
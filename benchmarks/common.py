@@ -0,0 +1,65 @@
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+# Run from the repository root, e.g. `python -m benchmarks.search`. Each
+# benchmark recreates the tables of BENCH_DATABASE_URL (a scratch database;
+# a temporary SQLite file by default) and seeds it with generated rows.
+
+WORDS = ['musical', 'hop', 'park', 'square', 'live', 'music', 'coffee', 'dueling', 'pianos', 'bar',
+         'gunz', 'blues', 'jazz', 'hall', 'house', 'club', 'lounge', 'garden', 'cellar', 'room']
+STATES = ['NY', 'CA', 'TX', 'WA', 'IL', 'MA', 'CO', 'GA', 'FL', 'OR']
+
+def configure(name):
+    # Has to run before the app is imported.
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if url is None:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fyyur-bench-'), f'{name}.sqlite')
+    os.environ['DATABASE_URL'] = url
+    os.environ.setdefault('DEFER_BACKGROUND_JOBS', '1')
+    os.environ.setdefault('JOBS_WORKERS', '0')
+    os.environ.setdefault('CACHE_BACKEND', 'none')
+    os.environ.setdefault('TEMPLATE_BYTECODE_CACHE', '')
+    return url
+
+def timed(function, repeat):
+    from pool_metrics import latency_summary
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return latency_summary(samples)
+
+def _name(rng, number):
+    return f'The {rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {number}'
+
+def seed(venues, artists=0, shows=0, cities=None, batch_size=10000, rng=None):
+    # Recreates the tables and inserts generated rows in executemany batches.
+    from models import db, Venue, Artist, Show
+    rng = rng or random.Random(1)
+    cities = cities or max(venues // 20, 1)
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+
+    def insert(table, count, row):
+        for start in range(0, count, batch_size):
+            db.session.execute(table.insert(), [row(number) for number in range(start, min(start + batch_size, count))])
+        db.session.commit()
+
+    insert(Venue.__table__, venues, lambda number: {
+        'name': _name(rng, number), 'city': f'City {number % cities}', 'state': STATES[number % len(STATES)],
+        'genres': 'Jazz', 'seeking_talent': False, 'num_upcoming_shows': 0, 'updated_at': now})
+    insert(Artist.__table__, artists, lambda number: {
+        'name': _name(rng, number), 'city': f'City {number % cities}', 'state': STATES[number % len(STATES)],
+        'genres': 'Jazz', 'seeking_venue': False, 'num_upcoming_shows': 0, 'updated_at': now})
+    insert(Show.__table__, shows, lambda number: {
+        'venue_id': number % venues + 1, 'artist_id': number % artists + 1,
+        'start_time': now + timedelta(hours=number * 3 - shows), 'duration': 120, 'updated_at': now})
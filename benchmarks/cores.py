@@ -0,0 +1,104 @@
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from benchmarks.common import configure, seed
+
+configure('cores')
+
+from app import app
+from pool_metrics import latency_summary
+
+# Throughput scaling of the production server across cores: gunicorn is
+# started from gunicorn.conf.py with 1, 2, 4, ... workers up to the core
+# count, and CLIENTS load-generating processes request the read pages over
+# keep-alive connections for DURATION seconds. The page cache is off so
+# that every request queries and renders. The clients share the machine
+# with the server, so leave some cores to them when reading the numbers.
+
+PATHS = ['/venues', '/venues/{id}', '/artists/{id}', '/shows', '/artists']
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, threads, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads), PORT=str(port),
+               CACHE_BACKEND='none')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    server.wait(60)
+
+def client(args):
+    number, port, clients, duration, entities = args
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    request = number
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        path = PATHS[request % len(PATHS)].format(id=request % entities + 1)
+        started = time.perf_counter()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        errors += response.status != 200
+        request += clients
+    connection.close()
+    return latencies, errors
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='gunicorn throughput scaling across worker processes.')
+    parser.add_argument('--workers', default=','.join(str(2 ** power) for power in range(cores.bit_length())
+                                                      if 2 ** power <= cores),
+                        help='comma-separated worker counts (default: powers of two up to the core count)')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker')
+    parser.add_argument('--clients', type=int, default=cores * 2)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--entities', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(venues=args.entities, artists=args.entities, shows=args.entities * 10)
+    baseline = None
+    print(f"{'workers':>8} {'req/s':>9} {'scaling':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    with multiprocessing.Pool(args.clients) as pool:
+        for workers in (int(workers) for workers in args.workers.split(',')):
+            port = free_port()
+            server = start_server(workers, args.threads, port)
+            try:
+                results = pool.map(client, [(number, port, args.clients, args.duration, args.entities)
+                                            for number in range(args.clients)])
+            finally:
+                stop_server(server)
+            latencies = [latency for own, _ in results for latency in own]
+            throughput = len(latencies) / args.duration
+            baseline = baseline or throughput
+            summary = latency_summary(latencies)
+            print(f"{workers:>8} {throughput:>9.1f} {throughput / baseline:>7.2f}x {summary['p50_ms']:>8} "
+                  f"{summary['p99_ms']:>8} {sum(errors for _, errors in results):>7}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+from benchmarks.common import configure
+
+configure('datetimes')
+
+from models import format_datetime, format_datetimes
+
+# Show time formatting for one page of N shows: the string round trip of the
+# original filter, applied twice per show as the views and templates did,
+# against format_datetime() per value and format_datetimes() per page.
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+def main():
+    parser = argparse.ArgumentParser(description='Show time formatting: legacy filter against the cached formatters.')
+    parser.add_argument('--shows', type=int, default=100, help='show times per page')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    start = datetime(2026, 1, 1, 20)
+    values = [start + timedelta(days=rng.randrange(365), hours=rng.randrange(4)) for _ in range(args.shows)]
+    assert format_datetimes(values, 'full') == [legacy_format_datetime(str(value), 'full') for value in values]
+
+    cases = {
+        'legacy, twice per show': lambda: [(legacy_format_datetime(str(value), 'full'),
+                                            legacy_format_datetime(str(value), 'full')) for value in values],
+        'format_datetime per show': lambda: [format_datetime(value, 'full') for value in values],
+        'format_datetimes per page': lambda: format_datetimes(values, 'full'),
+    }
+    baseline = None
+    print(f"{'case':<28} {'ms per page':>12} {'us per show':>12} {'speedup':>8}")
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or seconds
+        print(f"{name:<28} {seconds * 1000:>12.3f} {seconds / args.shows * 1e6:>12.2f} {baseline / seconds:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import threading
+import time
+from benchmarks.common import configure, seed
+
+configure('pool')
+
+from flask_sqlalchemy import get_state
+from app import app, db
+from pool_metrics import latency_summary, pool_stats
+
+# Load test of the connection pool: CLIENTS threads request venue and
+# artist pages for DURATION seconds against each pool size, and report
+# throughput, request latency and the pool's wait times, timeouts and
+# overflow events from /metrics/pool. Use a PostgreSQL BENCH_DATABASE_URL
+# for realistic numbers; the SQLite default shows the pool mechanics only.
+
+PATHS = ['/venues/{id}', '/artists/{id}', '/venues']
+
+def use_pool(size, overflow, timeout):
+    # Drops the engine so that the next query builds one with these options.
+    with app.app_context():
+        db.engine.dispose()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(pool_size=size, max_overflow=overflow, pool_timeout=timeout)
+    get_state(app).connectors.clear()
+    pool_stats.reset()
+
+def load(clients, duration, entities):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(number):
+        test_client = app.test_client()
+        own = []
+        request = number
+        while time.perf_counter() < deadline:
+            path = PATHS[request % len(PATHS)].format(id=request % entities + 1)
+            started = time.perf_counter()
+            status = test_client.get(path).status_code
+            own.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+            request += clients
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description='Connection pool load test.')
+    parser.add_argument('--sizes', default='1,2,5,10,20', help='comma-separated pool sizes')
+    parser.add_argument('--overflow', type=int, default=0)
+    parser.add_argument('--timeout', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--entities', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(venues=args.entities, artists=args.entities, shows=args.entities * 10)
+    app.test_client().get('/')  # builds the typeahead indexes
+    print(f"{'pool':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'wait p99 ms':>12} {'timeouts':>9} "
+          f"{'overflows':>10} {'errors':>7}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        use_pool(size, args.overflow, args.timeout)
+        latencies, errors = load(args.clients, args.duration, args.entities)
+        requests = latency_summary(latencies)
+        stats = pool_stats.snapshot()
+        print(f"{size:>5} {len(latencies) / args.duration:>9.1f} {requests['p50_ms']:>8} {requests['p99_ms']:>8} "
+              f"{stats['wait_time']['p99_ms']:>12} {stats['timeouts']:>9} {stats['overflow_events']:>10} "
+              f"{len(errors):>7}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import argparse
+from benchmarks.common import configure, seed, timed
+
+configure('search')
+
+from sqlalchemy import or_
+from models import app, Venue
+import search
+
+# Venue search latency at growing catalog sizes: the indexed search path
+# (pg_trgm on PostgreSQL, the n-gram index elsewhere) against the
+# unindexed ILIKE '%term%' scan it replaced.
+
+TERMS = ['hop', 'music', 'Park Square', 'city 7', 'zzz']
+
+def ilike_search(term):
+    pattern = f'%{term}%'
+    return Venue.query.filter(or_(Venue.name.ilike(pattern), Venue.city.ilike(pattern),
+                                  Venue.state.ilike(pattern))).all()
+
+def main():
+    parser = argparse.ArgumentParser(description='Venue search latency: indexed search against ILIKE.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma-separated venue counts')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'venues':>9} {'term':<12} {'ilike p50 ms':>13} {'ilike p99 ms':>13} {'index p50 ms':>13} {'index p99 ms':>13}")
+    with app.app_context():
+        for size in (int(size) for size in args.sizes.split(',')):
+            seed(venues=size)
+            search.reset_indexes()
+            search.venues('warm up')
+            for term in TERMS:
+                ilike = timed(lambda: ilike_search(term), args.repeat)
+                indexed = timed(lambda: search.venues(term), args.repeat)
+                print(f"{size:>9} {term:<12} {ilike['p50_ms']:>13} {ilike['p99_ms']:>13} "
+                      f"{indexed['p50_ms']:>13} {indexed['p99_ms']:>13}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from datetime import timedelta
+import click
+from flask.cli import AppGroup
+from models import app, db, Show, DEFAULT_SHOW_DURATION
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# A show books its venue and its artist from start_time for `duration`
+# minutes. On PostgreSQL the exclusion constraints added with the duration
+# column reject overlapping shows; check() runs the same test before the
+# insert so the form can say what is in the way, and conflict_report()
+# finds the overlaps already in the calendar.
+
+OWNERS = (
+    ('venue', Show.venue_id),
+    ('artist', Show.artist_id),
+)
+
+class BookingConflict(Exception):
+    def __init__(self, kind, show):
+        self.kind = kind
+        self.show = show
+        super().__init__(f'The {kind} is already booked from {show.start_time:%Y-%m-%d %H:%M} '
+                         f'until {end_time(show):%Y-%m-%d %H:%M}.')
+
+def end_time(show):
+    return show.start_time + timedelta(minutes=show.duration or DEFAULT_SHOW_DURATION)
+
+def is_conflict_error(error):
+    # IntegrityError raised by the exclusion constraints (exclusion_violation).
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '23P01'
+
+def check(show):
+    # Booked shows do not overlap each other, so only the last one starting
+    # before `show` ends can overlap it: one probe of the (owner,
+    # start_time) index per owner.
+    for kind, owner_column in OWNERS:
+        previous = Show.query.filter(
+            owner_column == getattr(show, owner_column.key),
+            Show.start_time < end_time(show)
+        )
+        if show.id is not None:
+            previous = previous.filter(Show.id != show.id)
+        previous = previous.order_by(Show.start_time.desc()).first()
+        if previous is not None and end_time(previous) > show.start_time:
+            raise BookingConflict(kind, previous)
+
+def _sweep(rows):
+    # `rows` are ordered by owner and start_time. Keeps the show that ends
+    # last so far for the current owner and pairs every show starting
+    # before that end with it.
+    owner = busy = busy_until = None
+    for row in rows:
+        finish = end_time(row)
+        if row.owner != owner:
+            owner, busy, busy_until = row.owner, row, finish
+            continue
+        if row.start_time < busy_until:
+            yield busy, row
+        if finish > busy_until:
+            busy, busy_until = row, finish
+
+def conflict_report(batch_size=5000):
+    # Every show that overlaps an earlier show of its venue or artist, in a
+    # single ordered pass per owner column.
+    for kind, owner_column in OWNERS:
+        rows = db.session.query(owner_column.label('owner'), Show.id, Show.start_time, Show.duration) \
+            .order_by(owner_column, Show.start_time, Show.id).yield_per(batch_size)
+        for earlier, later in _sweep(rows):
+            yield {
+                "kind": kind,
+                "owner_id": later.owner,
+                "show_id": later.id,
+                "start_time": later.start_time.isoformat(),
+                "overlaps": earlier.id
+            }
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+shows_cli = AppGroup('shows', help='Check show bookings.')
+
+@shows_cli.command('conflicts')
+def conflicts_command():
+    """List shows that overlap another show of the same venue or artist."""
+    count = 0
+    for conflict in conflict_report():
+        count += 1
+        click.echo(f"{conflict['kind']} {conflict['owner_id']}: show {conflict['show_id']} at "
+                   f"{conflict['start_time']} overlaps show {conflict['overlaps']}")
+    click.echo(f'{count} conflicting shows')
+
+app.cli.add_command(shows_cli)
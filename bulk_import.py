@@ -0,0 +1,308 @@
+import csv
+import hmac
+import io
+import json
+import os
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import app, db, Venue, Artist, Show, DEFAULT_SHOW_DURATION
+import bookings
+import counters
+import genres
+import images
+import search
+import typeahead
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Venues, artists and shows are streamed from CSV or JSONL files, validated
+# with the same forms as the create pages and inserted in batches of
+# BULK_IMPORT_BATCH_SIZE rows, each batch in its own transaction. Venue and
+# artist rows may carry an `id` from the source system; shows refer to them
+# by that id (or by an existing database id) and are resolved through the
+# id maps built while importing. Invalid rows are reported and skipped.
+# Thumbnails of the imported image links are requested once every batch is
+# in, as the create pages do after their commit.
+
+MAX_REPORTED_ERRORS = 1000
+
+def read_records(stream, format):
+    # Yields (record number, row, error) without loading the whole file.
+    if format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield number, None, {'row': [str(error)]}
+                continue
+            if isinstance(row, dict):
+                yield number, row, None
+            else:
+                yield number, None, {'row': ['Expected a JSON object']}
+    else:
+        for number, row in enumerate(csv.DictReader(stream), 1):
+            yield number, row, None
+
+def format_for(filename, format=None):
+    if format:
+        return format
+    return 'jsonl' if os.path.splitext(filename or '')[1].lower() in ('.jsonl', '.json') else 'csv'
+
+def _formdata(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if key == 'genres' and isinstance(value, str):
+            value = value.split(',')
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(key, str(item).strip())
+        elif value is not None:
+            formdata.add(key, str(value))
+    return formdata
+
+def _image_links(rows):
+    return {row['image_link'] for row in rows if row['image_link']}
+
+class Importer:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.venue_ids = {}
+        self.artist_ids = {}
+        self.report = {}
+        self.tags = set()
+        self.image_links = set()
+
+    #  Pipeline
+    #  ----------------------------------------------------------------
+
+    def run(self, kind, records):
+        form_class, insert = {
+            'venues': (VenueForm, self._insert_venues),
+            'artists': (ArtistForm, self._insert_artists),
+            'shows': (ShowForm, self._insert_shows),
+        }[kind]
+        prepare = self._resolve_shows if kind == 'shows' else lambda batch, report: batch
+        report = self.report.setdefault(kind, {"inserted": 0, "failed": 0, "errors": []})
+        batch = []
+        for number, row, error in records:
+            if error is None:
+                form = form_class(formdata=_formdata(row), meta={'csrf': False})
+                if form.validate():
+                    batch.append((number, row.get('id'), form.data))
+                else:
+                    error = form.errors
+            if error is not None:
+                self._error(report, number, error)
+            if len(batch) >= self.batch_size:
+                self._flush(prepare(batch, report), insert, report)
+                batch = []
+        if batch:
+            self._flush(prepare(batch, report), insert, report)
+        return report
+
+    def _error(self, report, number, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"record": number, "errors": error})
+
+    def _flush(self, batch, insert, report):
+        if not batch:
+            return
+        try:
+            self._commit(insert(batch), report)
+        except (SQLAlchemyError, bookings.BookingConflict):
+            db.session.rollback()
+            # Retry row by row to isolate the rows the database rejects.
+            for item in batch:
+                try:
+                    self._commit(insert([item]), report)
+                except (SQLAlchemyError, bookings.BookingConflict) as error:
+                    db.session.rollback()
+                    self._error(report, item[0], {'row': [str(getattr(error, 'orig', error))]})
+
+    def _commit(self, result, report):
+        inserted, id_map, keys, tags, image_links = result
+        db.session.commit()
+        report["inserted"] += inserted
+        id_map.update(keys)
+        self.tags.update(tags)
+        self.image_links.update(image_links)
+
+    #  Inserts
+    #  ----------------------------------------------------------------
+
+    def _new_ids(self, model, count):
+        # Draws the primary keys up front so a whole batch goes in with one
+        # executemany and the source ids can still be mapped.
+        table = model.__table__
+        if db.engine.dialect.name == 'postgresql':
+            sequence = func.nextval(func.pg_get_serial_sequence(f'"{table.name}"', 'id'))
+            return [row[0] for row in db.session.execute(
+                db.select([sequence]).select_from(func.generate_series(1, count)))]
+        return None
+
+    def _insert_owners(self, model, rows):
+        table = model.__table__
+        ids = self._new_ids(model, len(rows))
+        if ids is not None:
+            for row, new_id in zip(rows, ids):
+                row['id'] = new_id
+            db.session.execute(table.insert(), rows)
+            return ids
+        return [db.session.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+    def _insert_venues(self, batch):
+        rows = [{
+            "name": data['name'],
+            "city": data['city'],
+            "state": data['state'],
+            "address": data['address'],
+            "phone": data['phone'],
+            "genres": ','.join(data['genres']),
+            "image_link": data['image_link'],
+            "facebook_link": data['facebook_link'],
+            "website_link": data['website_link'],
+            "seeking_talent": data['seeking_talent'],
+            "seeking_description": data['seeking_description'],
+            "num_upcoming_shows": 0
+        } for _, _, data in batch]
+        ids = self._insert_owners(Venue, rows)
+        genres.link_venues(zip(ids, (data['genres'] for _, _, data in batch)))
+        keys = {str(key): new_id for (_, key, _), new_id in zip(batch, ids) if key not in (None, '')}
+        return len(ids), self.venue_ids, keys, {'venues'}, _image_links(rows)
+
+    def _insert_artists(self, batch):
+        rows = [{
+            "name": data['name'],
+            "city": data['city'],
+            "state": data['state'],
+            "phone": data['phone'],
+            "genres": ','.join(data['genres']),
+            "image_link": data['image_link'],
+            "facebook_link": data['facebook_link'],
+            "website_link": data['website_link'],
+            "seeking_venue": data['seeking_venue'],
+            "seeking_description": data['seeking_description'],
+            "num_upcoming_shows": 0
+        } for _, _, data in batch]
+        ids = self._insert_owners(Artist, rows)
+        genres.link_artists(zip(ids, (data['genres'] for _, _, data in batch)))
+        keys = {str(key): new_id for (_, key, _), new_id in zip(batch, ids) if key not in (None, '')}
+        return len(ids), self.artist_ids, keys, {'artists'}, _image_links(rows)
+
+    def _resolver(self, model, id_map, keys):
+        # Keys missing from the id map must be ids already in the database.
+        unknown = {int(key) for key in keys if str(key) not in id_map and str(key).isdigit()}
+        existing = {row[0] for row in db.session.query(model.id).filter(model.id.in_(unknown))} if unknown else set()
+        def resolve(key):
+            key = str(key)
+            if key in id_map:
+                return id_map[key]
+            if key.isdigit() and int(key) in existing:
+                return int(key)
+            return None
+        return resolve
+
+    def _resolve_shows(self, batch, report):
+        # Maps the batch's venue and artist keys to database ids before the
+        # insert, so rows with unknown ids are reported once, even when the
+        # batch is retried row by row.
+        venue = self._resolver(Venue, self.venue_ids, [data['venue_id'] for _, _, data in batch])
+        artist = self._resolver(Artist, self.artist_ids, [data['artist_id'] for _, _, data in batch])
+        resolved = []
+        for number, key, data in batch:
+            venue_id, artist_id = venue(data['venue_id']), artist(data['artist_id'])
+            if venue_id is None or artist_id is None:
+                self._error(report, number, {
+                    field: ['Unknown id'] for field, value in (('venue_id', venue_id), ('artist_id', artist_id))
+                    if value is None})
+                continue
+            resolved.append((number, key, dict(data, venue_id=venue_id, artist_id=artist_id)))
+        return resolved
+
+    def _insert_shows(self, batch):
+        rows = [{"venue_id": data['venue_id'], "artist_id": data['artist_id'], "start_time": data['start_time'],
+                 "duration": data['duration'] or DEFAULT_SHOW_DURATION} for _, _, data in batch]
+        if rows:
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(Show.__table__.insert(), rows)
+            else:
+                # Without the exclusion constraints every show is checked
+                # against the calendar, including the shows inserted before it.
+                for row in rows:
+                    bookings.check(Show(**row))
+                    db.session.execute(Show.__table__.insert(), row)
+            counters.shows_added(rows)
+        tags = {'shows', 'venues'}
+        tags.update(f"venue:{row['venue_id']}" for row in rows)
+        tags.update(f"artist:{row['artist_id']}" for row in rows)
+        return len(rows), {}, {}, tags, set()
+
+    def finish(self):
+        # Brings the derived structures up to date once, after all batches.
+        page_cache.invalidate(*self.tags)
+        search.reset_indexes()
+        typeahead.refresh()
+        for link in self.image_links:
+            images.request_thumbnail(link)
+        return self.report
+
+def import_catalog(sources, batch_size=None):
+    # `sources` maps 'venues', 'artists' and 'shows' to (text stream,
+    # format); they are imported in that order so shows can be resolved.
+    importer = Importer(batch_size or app.config['BULK_IMPORT_BATCH_SIZE'])
+    for kind in ('venues', 'artists', 'shows'):
+        if kind in sources:
+            stream, format = sources[kind]
+            importer.run(kind, read_records(stream, format))
+    return importer.finish()
+
+def authorized(header):
+    # POST /import takes `Authorization: Bearer <IMPORT_TOKEN>`; a custom
+    # header cannot be sent cross-site, so the form CSRF check is not needed.
+    token = app.config['IMPORT_TOKEN']
+    scheme, _, credentials = (header or '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and \
+        hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+def upload_sources(files, format=None):
+    return {
+        kind: (io.TextIOWrapper(upload.stream, encoding='utf-8'), format_for(upload.filename, format))
+        for kind, upload in files.items() if kind in ('venues', 'artists', 'shows')
+    }
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+import_cli = AppGroup('import', help='Bulk import venues, artists and shows.')
+
+@import_cli.command('catalog')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False))
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False))
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+def import_catalog_command(venues, artists, shows, format, batch_size):
+    """Import CSV or JSONL files and print the per-row report as JSON."""
+    paths = {'venues': venues, 'artists': artists, 'shows': shows}
+    files = {kind: open(path, newline='', encoding='utf-8') for kind, path in paths.items() if path}
+    try:
+        report = import_catalog(
+            {kind: (stream, format_for(paths[kind], format)) for kind, stream in files.items()},
+            batch_size)
+    finally:
+        for stream in files.values():
+            stream.close()
+    click.echo(json.dumps(report, indent=2, default=str))
+
+app.cli.add_command(import_cli)
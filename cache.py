@@ -0,0 +1,233 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, has_request_context, make_response, request, session
+from models import app
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Rendered GET pages are cached by path and query string. Every entry
+# carries tags naming the rows it was built from ('venues', 'venue:3', ...)
+# and the write handlers invalidate those tags after they commit. Entries
+# also expire after CACHE_TTL seconds, since the past/upcoming split of a
+# page goes stale as time passes. Under @conditional an entry also keeps the
+# ETag it was rendered for, and one whose ETag no longer matches the
+# database is a miss, so a page is never served with a newer ETag than
+# its body.
+
+class LRUBackend:
+    # In-process backend, private to each worker.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires, tags = entry
+            if expires < time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, time.time() + ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+class SharedBackend:
+    # Local stand-in for a shared cache server: a SQLite file that every
+    # worker process on the host reads and invalidates.
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires REAL);
+            CREATE TABLE IF NOT EXISTS tags (tag TEXT, key TEXT);
+            CREATE INDEX IF NOT EXISTS ix_tags_tag ON tags (tag);
+            CREATE INDEX IF NOT EXISTS ix_tags_key ON tags (key);
+        ''')
+
+    def _connection(self):
+        # A connection inherited from the parent of a forked worker is
+        # dropped, not shared.
+        if getattr(self._local, 'pid', os.getpid()) != os.getpid():
+            self._local = threading.local()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl, tags):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('DELETE FROM tags WHERE key = ?', (key,))
+            connection.execute('INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)',
+                               (key, pickle.dumps(value), time.time() + ttl))
+            connection.executemany('INSERT INTO tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in tags])
+            connection.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+            connection.execute('DELETE FROM entries WHERE key IN ('
+                               'SELECT key FROM entries ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                               (self.max_entries,))
+            connection.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        if not tags:
+            return
+        marks = ', '.join('?' * len(tags))
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute(f'DELETE FROM entries WHERE key IN (SELECT key FROM tags WHERE tag IN ({marks}))', tags)
+            connection.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            connection.execute('DELETE FROM entries')
+            connection.execute('DELETE FROM tags')
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM entries').fetchone()[0]
+
+class PageCache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, *tags):
+        # `tags` are format strings filled in from the view arguments, e.g.
+        # 'venue:{venue_id}'. Views add the tags of related rows they render
+        # through depends_on().
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages carrying flashed messages belong to a single visitor.
+                if self.backend is None or session.get('_flashes'):
+                    return view(**kwargs)
+
+                key = request.full_path
+                etag = g.get('page_etag')
+                if not g.get('pinned_to_primary'):
+                    response = self.get(key, etag)
+                    if response is not None:
+                        return response
+
+                g.cache_tags = {tag.format(**kwargs) for tag in tags}
+                response = make_response(view(**kwargs))
+                if not session.get('_flashes'):
+                    self.set(key, response, g.cache_tags, etag)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def get(self, key, etag=None):
+        # The cached response for `key` rendered for `etag`, or None after
+        # counting a miss.
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None or value[3] != etag:
+            self.misses += 1
+            return None
+        self.hits += 1
+        body, status, mimetype, _ = value
+        response = app.response_class(body, status=status, mimetype=mimetype)
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    def entry_ttl(self):
+        # Pages read from a replica may predate invalidations made on the
+        # primary, so they are kept for REPLICA_CACHE_TTL seconds only.
+        if has_request_context() and g.get('read_replica'):
+            return app.config['REPLICA_CACHE_TTL']
+        return self.ttl
+
+    def set(self, key, response, tags, etag=None, ttl=None):
+        ttl = self.entry_ttl() if ttl is None else ttl
+        if self.backend is not None and ttl > 0 and response.status_code == 200 and not response.is_streamed:
+            self.backend.set(key, (response.get_data(), response.status_code, response.mimetype, etag),
+                             ttl, tags)
+
+    def depends_on(self, *tags):
+        if 'cache_tags' in g:
+            g.cache_tags.update(tags)
+
+    def invalidate(self, *tags):
+        if self.backend is not None:
+            self.backend.invalidate(tags)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+def _backend(config):
+    if config['CACHE_BACKEND'] == 'lru':
+        return LRUBackend(config['CACHE_MAX_ENTRIES'])
+    if config['CACHE_BACKEND'] == 'shared':
+        return SharedBackend(config['CACHE_SHARED_PATH'], config['CACHE_MAX_ENTRIES'])
+    return None
+
+page_cache = PageCache(_backend(app.config), app.config['CACHE_TTL'])
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+import click
+from flask.cli import AppGroup
+from sqlalchemy import tuple_
+from models import app, db, Venue, Artist, Show, CounterWatermark, CityDay, CityCalendarDirty
+
+#----------------------------------------------------------------------------#
+# City calendar.
+#----------------------------------------------------------------------------#
+
+# CityDay holds, for every city and each day from today to CITY_CALENDAR_DAYS
+# ahead, the number of shows and the first CITY_CALENDAR_TOP_SHOWS of them,
+# so a city's week is one range read of its primary key. refresh() only
+# recomputes the cities touched since its watermark: cities of venues, shows
+# and artists whose updated_at moved (bulk imports included) and the cities
+# queued by mark_venue_city(). The first refresh of a day recomputes every
+# city, since the horizon moves by a day.
+
+WATERMARK = 'city_calendar'
+
+# Transactions still open when a refresh starts can commit rows stamped
+# before it; they are picked up by the next refresh.
+WATERMARK_SLACK = timedelta(minutes=1)
+
+BATCH_SIZE = 500
+
+def mark_venue_city(venue_id):
+    # Call in the session that moves the venue to another city or deletes
+    # it, before the change: the venue's current city is queued for the
+    # next refresh.
+    row = db.session.query(Venue.state, Venue.city).filter(Venue.id == venue_id).one_or_none()
+    if row is not None and row.state and row.city:
+        db.session.merge(CityCalendarDirty(state=row.state, city=row.city))
+
+def _watermark():
+    watermark = CounterWatermark.query.filter_by(name=WATERMARK).with_for_update().one_or_none()
+    if watermark is None:
+        watermark = CounterWatermark(name=WATERMARK, rolled_at=datetime(1970, 1, 1))
+        db.session.add(watermark)
+    return watermark
+
+def _batches(items):
+    items = list(items)
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+def _touched_cities(since, today):
+    located = db.session.query(Venue.state, Venue.city) \
+        .filter(Venue.state.isnot(None), Venue.city.isnot(None))
+    queries = [
+        located.filter(Venue.updated_at > since),
+        located.join(Show, Show.venue_id == Venue.id).filter(Show.updated_at > since),
+        located.join(Show, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+            .filter(Artist.updated_at > since, Show.start_time >= today),
+        db.session.query(CityCalendarDirty.state, CityCalendarDirty.city),
+    ]
+    return {tuple(row) for query in queries for row in query.distinct()}
+
+def _city_days(cities, start, end):
+    # CityDay rows for `cities` (every city when None), from one ordered
+    # pass over their shows between start and end.
+    top = app.config['CITY_CALENDAR_TOP_SHOWS']
+    shows = db.session.query(
+        Venue.state,
+        Venue.city,
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id) \
+        .filter(Show.start_time >= start, Show.start_time < end,
+                Venue.state.isnot(None), Venue.city.isnot(None))
+    batches = [None] if cities is None else _batches(cities)
+    for batch in batches:
+        query = shows if batch is None else shows.filter(tuple_(Venue.state, Venue.city).in_(batch))
+        query = query.order_by(Venue.state, Venue.city, Show.start_time, Show.id)
+        for (state, city, day), day_shows in groupby(query, key=lambda row: (row.state, row.city, row.start_time.date())):
+            day_shows = list(day_shows)
+            yield {
+                "state": state,
+                "city": city,
+                "day": day,
+                "show_count": len(day_shows),
+                "shows": json.dumps([{
+                    "id": show.id,
+                    "start_time": show.start_time.isoformat(),
+                    "venue_id": show.venue_id,
+                    "venue_name": show.venue_name,
+                    "artist_id": show.artist_id,
+                    "artist_name": show.artist_name,
+                    "artist_image_link": show.artist_image_link
+                } for show in day_shows[:top]])
+            }
+
+def refresh(full=False):
+    # Returns the number of cities recomputed (None for all of them).
+    started = datetime.utcnow()
+    today = date.today()
+    start = datetime.combine(today, datetime.min.time())
+    end = start + timedelta(days=app.config['CITY_CALENDAR_DAYS'])
+
+    watermark = _watermark()
+    last_day = watermark.rolled_at.replace(tzinfo=timezone.utc).astimezone().date()
+    full = full or last_day < today
+    cities = None if full else _touched_cities(watermark.rolled_at, start)
+
+    if full:
+        CityDay.query.delete(synchronize_session=False)
+        CityCalendarDirty.query.delete(synchronize_session=False)
+    else:
+        for batch in _batches(cities):
+            for model in (CityDay, CityCalendarDirty):
+                model.query.filter(tuple_(model.state, model.city).in_(batch)) \
+                    .delete(synchronize_session=False)
+    if full or cities:
+        rows = list(_city_days(cities, start, end))
+        if rows:
+            db.session.execute(CityDay.__table__.insert(), rows)
+    watermark.rolled_at = started - WATERMARK_SLACK
+    db.session.commit()
+    return None if full else len(cities)
+
+def start_refresh(interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    refresh()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Refreshing the city calendar failed')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='city-calendar-refresh', daemon=True)
+    thread.start()
+    return thread
+
+#  Reads
+#  ----------------------------------------------------------------
+
+def city_calendar(state, city, start, days):
+    # One range read of CityDay's primary key; days without shows are
+    # filled in with empty entries.
+    rows = db.session.query(CityDay.day, CityDay.show_count, CityDay.shows).filter(
+        CityDay.state == state,
+        CityDay.city == city,
+        CityDay.day >= start,
+        CityDay.day < start + timedelta(days=days)
+    ).order_by(CityDay.day).all()
+    by_day = {row.day: row for row in rows}
+    calendar = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day)
+        calendar.append({
+            "day": day,
+            "show_count": row.show_count if row is not None else 0,
+            "shows": json.loads(row.shows) if row is not None else []
+        })
+    return calendar
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+calendar_cli = AppGroup('calendar', help='Maintain the city calendar.')
+
+@calendar_cli.command('refresh')
+@click.option('--full', is_flag=True, help='Recompute every city.')
+def refresh_command(full):
+    """Recompute the city calendar rows touched since the last refresh."""
+    cities = refresh(full=full)
+    click.echo('City calendar rebuilt' if cities is None else f'{cities} cities refreshed')
+
+app.cli.add_command(calendar_cli)
@@ -0,0 +1,59 @@
+import hashlib
+from functools import wraps
+from flask import g, make_response, request, session
+from werkzeug.http import is_resource_modified
+from models import app
+from queries import run
+
+#----------------------------------------------------------------------------#
+# Conditional responses.
+#----------------------------------------------------------------------------#
+
+# Pages carry an ETag and a Last-Modified taken from a validator plan (see
+# the page validators in queries.py) that runs before the view. When the
+# client's If-None-Match or If-Modified-Since still matches, an empty 304 is
+# sent without loading the page's rows, rendering it or reading the page
+# cache. Otherwise the ETag is left in g.page_etag for the page cache,
+# which only reuses what was rendered for it. PAGE_VERSION goes into every
+# ETag so that a deploy changing the markup can retire the validators
+# clients hold.
+
+def validators(validated):
+    last_modified, state = validated
+    etag = hashlib.sha1(repr((app.config['PAGE_VERSION'], state)).encode('utf-8')).hexdigest()
+    return etag, last_modified.replace(microsecond=0)
+
+def not_modified(environ, etag, last_modified):
+    return not is_resource_modified(environ, etag=etag, last_modified=last_modified)
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def conditional(validator):
+    # `validator` is called with the view arguments and returns a plan whose
+    # result is (last_modified, state), or None to leave the request to the
+    # view (e.g. so that it can 404).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # Pages carrying flashed messages belong to a single visitor.
+            if session.get('_flashes'):
+                return view(**kwargs)
+            validated = run(validator(**kwargs))
+            if validated is None:
+                return view(**kwargs)
+
+            etag, last_modified = validators(validated)
+            if not_modified(request.environ, etag, last_modified):
+                response = app.response_class(status=304)
+            else:
+                g.page_etag = etag
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, case, func
+from models import app, db, Venue, Artist, Show, CounterWatermark
+
+#----------------------------------------------------------------------------#
+# Upcoming show counters.
+#----------------------------------------------------------------------------#
+
+# Venue.num_upcoming_shows and Artist.num_upcoming_shows hold the number of
+# shows starting after the watermark. Inserting or deleting a show adjusts
+# them by one, the roll-forward job moves the watermark up to now and
+# subtracts the shows that started in between, and rebuild() recounts
+# everything from scratch. Adding or removing a show also moves the venue's
+# and the artist's updated_at, past shows included, which the detail page
+# validators in queries.py rely on.
+
+WATERMARK = 'upcoming_shows'
+
+OWNERS = (
+    (Venue, Show.venue_id),
+    (Artist, Show.artist_id),
+)
+
+def _watermark(lock=False):
+    query = CounterWatermark.query.filter_by(name=WATERMARK)
+    if lock:
+        query = query.with_for_update()
+    watermark = query.one_or_none()
+    if watermark is None:
+        watermark = CounterWatermark(name=WATERMARK, rolled_at=datetime.now())
+        db.session.add(watermark)
+    return watermark
+
+def _increment(model, owner_id, delta):
+    model.query.filter(model.id == owner_id).update(
+        {model.num_upcoming_shows: func.coalesce(model.num_upcoming_shows, 0) + delta},
+        synchronize_session=False)
+
+def _apply_deltas(model, deltas):
+    # One executemany UPDATE for all the owners in `deltas` ({id: delta}).
+    if not deltas:
+        return
+    table = model.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('owner_id'))
+        .values(num_upcoming_shows=func.coalesce(table.c.num_upcoming_shows, 0) + bindparam('delta')),
+        [{'owner_id': owner_id, 'delta': delta} for owner_id, delta in deltas.items()])
+
+def _subtract_grouped(model, owner_column, criterion):
+    # One grouped read and one executemany UPDATE per owner table, so the
+    # cost follows the number of shows matched, not the size of the tables.
+    rows = db.session.query(owner_column, func.count(Show.id)) \
+        .filter(criterion).group_by(owner_column).all()
+    _apply_deltas(model, {owner_id: -crossed for owner_id, crossed in rows})
+    return sum(crossed for _, crossed in rows)
+
+def show_added(show):
+    # Call before committing the session that inserts `show`.
+    delta = 1 if show.start_time > _watermark().rolled_at else 0
+    _increment(Venue, show.venue_id, delta)
+    _increment(Artist, show.artist_id, delta)
+
+def shows_added(shows):
+    # Bulk counterpart of show_added() for rows inserted without the ORM;
+    # `shows` are dicts with venue_id, artist_id and start_time.
+    rolled_at = _watermark().rolled_at
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        deltas = Counter()
+        for show in shows:
+            deltas[show[key]] += show['start_time'] > rolled_at
+        _apply_deltas(model, deltas)
+
+def show_removed(show):
+    # Call before committing the session that deletes `show`.
+    delta = -1 if show.start_time > _watermark().rolled_at else 0
+    _increment(Venue, show.venue_id, delta)
+    _increment(Artist, show.artist_id, delta)
+
+def shows_removed(criterion):
+    # Bulk counterpart of show_removed() for the shows matching `criterion`.
+    upcoming = func.count(case([(Show.start_time > _watermark().rolled_at, 1)]))
+    for model, owner_column in OWNERS:
+        rows = db.session.query(owner_column, upcoming).filter(criterion).group_by(owner_column)
+        _apply_deltas(model, {owner_id: -count for owner_id, count in rows})
+
+def roll_forward(now=None):
+    now = now or datetime.now()
+    watermark = _watermark(lock=True)
+    crossed = 0
+    if now > watermark.rolled_at:
+        started = and_(Show.start_time > watermark.rolled_at, Show.start_time <= now)
+        crossed = _subtract_grouped(Venue, Show.venue_id, started)
+        _subtract_grouped(Artist, Show.artist_id, started)
+        watermark.rolled_at = now
+    db.session.commit()
+    return crossed
+
+def rebuild(now=None):
+    now = now or datetime.now()
+    watermark = _watermark(lock=True)
+    for model, owner_column in OWNERS:
+        upcoming = db.session.query(func.count(Show.id)) \
+            .filter(owner_column == model.id, Show.start_time > now) \
+            .scalar_subquery()
+        model.query.update({model.num_upcoming_shows: upcoming}, synchronize_session=False)
+    watermark.rolled_at = now
+    db.session.commit()
+
+def start_roll_forward(interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    roll_forward()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Rolling upcoming show counters forward failed')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='counters-roll-forward', daemon=True)
+    thread.start()
+    return thread
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+counters_cli = AppGroup('counters', help='Maintain the upcoming show counters.')
+
+@counters_cli.command('roll-forward')
+def roll_forward_command():
+    """Subtract shows that have started since the last roll forward."""
+    crossed = roll_forward()
+    click.echo(f'{crossed} shows moved from upcoming to past')
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    """Recount every venue and artist counter from the Show table."""
+    rebuild()
+    click.echo('Upcoming show counters rebuilt')
+
+app.cli.add_command(counters_cli)
@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+import struct
+import sys
+import zlib
+from datetime import date, datetime, timedelta
+from itertools import islice
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+from models import app, db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# Tables are read through a server-side cursor EXPORT_CHUNK_SIZE rows at a
+# time and written out chunk by chunk, so memory stays flat whatever the
+# table size. Shows can be limited to a start_time range. Incremental
+# exports pass the updated_at watermark returned by the previous export and
+# only get rows added or changed since; deletions are not carried over.
+
+# Transactions still open when an export starts can commit rows stamped
+# before its watermark, so the watermark is held WATERMARK_SLACK behind the
+# clock. The next export repeats the rows of that interval and the reader
+# keeps the last copy of each id.
+WATERMARK_SLACK = timedelta(minutes=1)
+
+MODELS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'fyc': 'application/octet-stream',
+}
+
+def _value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+class Export:
+    def __init__(self, kind, start=None, end=None, since=None):
+        model = MODELS[kind]
+        self.kind = kind
+        self.columns = [column.name for column in model.__table__.columns]
+        query = db.session.query(*model.__table__.columns)
+        if kind == 'shows':
+            if start is not None:
+                query = query.filter(Show.start_time >= start)
+            if end is not None:
+                query = query.filter(Show.start_time < end)
+        if since is not None:
+            query = query.filter(model.updated_at > since)
+        # Rows written while the export runs are left for the next one.
+        latest = db.session.query(func.max(model.updated_at)).scalar()
+        self.watermark = since
+        if latest is not None:
+            query = query.filter(model.updated_at <= latest)
+            self.watermark = min(latest, datetime.utcnow() - WATERMARK_SLACK)
+        self.query = query.order_by(model.updated_at, model.id)
+
+    def chunks(self, size):
+        rows = iter(self.query.yield_per(size))
+        while True:
+            chunk = list(islice(rows, size))
+            if not chunk:
+                return
+            yield [[_value(value) for value in row] for row in chunk]
+
+    def write(self, format, size):
+        return getattr(self, f'_write_{format}')(size)
+
+    def _write_csv(self, size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.columns)
+        for chunk in self.chunks(size):
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _write_jsonl(self, size):
+        for chunk in self.chunks(size):
+            yield ''.join(json.dumps(dict(zip(self.columns, row))) + '\n' for row in chunk).encode('utf-8')
+
+    def _write_fyc(self, size):
+        # Columnar layout: b'FYC1', a length-prefixed JSON header, then for
+        # every chunk its row count followed by one zlib-compressed JSON
+        # array per column; a zero row count ends the file.
+        header = json.dumps({"table": self.kind, "columns": self.columns}).encode('utf-8')
+        yield b'FYC1' + struct.pack('<I', len(header)) + header
+        for chunk in self.chunks(size):
+            parts = [struct.pack('<I', len(chunk))]
+            for values in zip(*chunk):
+                block = zlib.compress(json.dumps(values).encode('utf-8'))
+                parts.append(struct.pack('<I', len(block)) + block)
+            yield b''.join(parts)
+        yield struct.pack('<I', 0)
+
+def read_columnar(stream):
+    # Reads an export written in the 'fyc' format back as dicts.
+    if stream.read(4) != b'FYC1':
+        raise ValueError('Not a columnar export')
+    (length,) = struct.unpack('<I', stream.read(4))
+    columns = json.loads(stream.read(length))["columns"]
+    while True:
+        (count,) = struct.unpack('<I', stream.read(4))
+        if not count:
+            return
+        values = []
+        for _ in columns:
+            (length,) = struct.unpack('<I', stream.read(4))
+            values.append(json.loads(zlib.decompress(stream.read(length))))
+        for row in zip(*values):
+            yield dict(zip(columns, row))
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+export_cli = AppGroup('export', help='Export the catalog.')
+
+@export_cli.command('table')
+@click.argument('kind', type=click.Choice(sorted(MODELS)))
+@click.option('--format', 'format', type=click.Choice(sorted(FORMATS)), default='csv')
+@click.option('--output', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+@click.option('--start', type=click.DateTime(), help='Shows starting at or after this time.')
+@click.option('--end', type=click.DateTime(), help='Shows starting before this time.')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']),
+              help='Watermark printed by a previous export.')
+def export_table_command(kind, format, output, start, end, since):
+    """Stream a table to a file and print the watermark for the next run."""
+    export = Export(kind, start, end, since)
+    stream = open(output, 'wb') if output else sys.stdout.buffer
+    try:
+        for chunk in export.write(format, app.config['EXPORT_CHUNK_SIZE']):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+    if export.watermark is not None:
+        click.echo(f'watermark: {export.watermark.isoformat()}', err=True)
+
+app.cli.add_command(export_cli)
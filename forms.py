@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,10 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1)]
+    )
 
 class VenueForm(Form):
     name = StringField(
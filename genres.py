@@ -0,0 +1,148 @@
+import click
+from flask.cli import AppGroup
+from collections import Counter, defaultdict
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import app, db, Genre, venue_genres, artist_genres
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# Venue.genres and Artist.genres keep the comma-joined names for display;
+# filtering and the facet counts go through the Genre table. Every change
+# adjusts the counts of only the genres that were added or removed, with
+# UPDATE ... SET count = count + n so that concurrent edits and imports do
+# not lose each other's changes.
+
+def parse_genres(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for name in value:
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def _insert_missing(names):
+    # Another request may be adding the same new genre: the conflicting
+    # insert is skipped and the row it committed is used instead.
+    rows = [{'name': name, 'venue_count': 0, 'artist_count': 0} for name in names]
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        db.session.execute(insert(Genre).values(rows).on_conflict_do_nothing(index_elements=['name']))
+        return
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(Genre.__table__.insert(), row)
+        except IntegrityError:
+            pass
+
+def _genres_named(names):
+    if not names:
+        return []
+    existing = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        _insert_missing(missing)
+        existing.update((genre.name, genre) for genre in Genre.query.filter(Genre.name.in_(missing)))
+    return [existing[name] for name in names]
+
+def _add_to_counts(count_column, deltas):
+    # `deltas` maps genres to the amount added to their count; one UPDATE
+    # per distinct amount.
+    column = getattr(Genre, count_column)
+    by_delta = defaultdict(list)
+    for genre, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(genre.id)
+    for delta, genre_ids in by_delta.items():
+        Genre.query.filter(Genre.id.in_(genre_ids)) \
+            .update({column: func.coalesce(column, 0) + delta}, synchronize_session=False)
+    for genre in deltas:
+        db.session.expire(genre, [count_column])
+
+def _set_genres(owner, names, count_column):
+    names = parse_genres(names)
+    old = set(owner.genre_items)
+    new = _genres_named(names)
+    deltas = {genre: -1 for genre in old.difference(new)}
+    deltas.update((genre, 1) for genre in set(new).difference(old))
+    _add_to_counts(count_column, deltas)
+    owner.genre_items = new
+    owner.genres = ','.join(names)
+
+def set_venue_genres(venue, names):
+    _set_genres(venue, names, 'venue_count')
+
+def set_artist_genres(artist, names):
+    _set_genres(artist, names, 'artist_count')
+
+def _link(table, owner_column, count_column, pairs):
+    # Bulk counterpart of _set_genres() for freshly inserted owners given as
+    # (id, names) pairs: one executemany INSERT of the links and one count
+    # adjustment per genre involved.
+    pairs = [(owner_id, parse_genres(names)) for owner_id, names in pairs]
+    counts = Counter(name for _, names in pairs for name in names)
+    if not counts:
+        return
+    by_name = {genre.name: genre for genre in _genres_named(sorted(counts))}
+    db.session.flush()
+    db.session.execute(table.insert(), [
+        {owner_column: owner_id, 'genre_id': by_name[name].id}
+        for owner_id, names in pairs for name in names])
+    _add_to_counts(count_column, {by_name[name]: count for name, count in counts.items()})
+
+def link_venues(pairs):
+    _link(venue_genres, 'venue_id', 'venue_count', pairs)
+
+def link_artists(pairs):
+    _link(artist_genres, 'artist_id', 'artist_count', pairs)
+
+def venue_removed(venue_id):
+    # Call before deleting the venue row.
+    genre_ids = db.session.query(venue_genres.c.genre_id).filter(venue_genres.c.venue_id == venue_id)
+    Genre.query.filter(Genre.id.in_(genre_ids)) \
+        .update({Genre.venue_count: Genre.venue_count - 1}, synchronize_session=False)
+    db.session.execute(venue_genres.delete().where(venue_genres.c.venue_id == venue_id))
+
+def venue_facets_query():
+    return db.session.query(Genre.name, Genre.venue_count.label('count')) \
+        .filter(Genre.venue_count > 0).order_by(Genre.name)
+
+def artist_facets_query():
+    return db.session.query(Genre.name, Genre.artist_count.label('count')) \
+        .filter(Genre.artist_count > 0).order_by(Genre.name)
+
+def venues_with_genre(name):
+    return db.session.query(venue_genres.c.venue_id) \
+        .join(Genre, Genre.id == venue_genres.c.genre_id).filter(Genre.name == name)
+
+def artists_with_genre(name):
+    return db.session.query(artist_genres.c.artist_id) \
+        .join(Genre, Genre.id == artist_genres.c.genre_id).filter(Genre.name == name)
+
+def rebuild_facets():
+    for column, table in (('venue_count', venue_genres), ('artist_count', artist_genres)):
+        count = db.session.query(func.count()).select_from(table) \
+            .filter(table.c.genre_id == Genre.id).scalar_subquery()
+        Genre.query.update({getattr(Genre, column): count}, synchronize_session=False)
+    db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+genres_cli = AppGroup('genres', help='Maintain the genre facet counts.')
+
+@genres_cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recount venues and artists per genre from the association tables."""
+    rebuild_facets()
+    click.echo('Genre facet counts rebuilt')
+
+app.cli.add_command(genres_cli)
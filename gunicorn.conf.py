@@ -0,0 +1,55 @@
+import gc
+import multiprocessing
+import os
+
+#----------------------------------------------------------------------------#
+# Gunicorn.
+#----------------------------------------------------------------------------#
+
+# Read by `gunicorn wsgi:app` from the working directory. The app is loaded
+# in the master before the workers are forked, so the code, models and
+# compiled templates are shared copy-on-write. Each worker serves
+# WEB_THREADS requests at a time and is replaced after about
+# WEB_MAX_REQUESTS requests. On SIGTERM the workers finish their in-flight
+# requests for up to WEB_GRACEFUL_TIMEOUT seconds before exiting.
+
+os.environ['DEFER_BACKGROUND_JOBS'] = '1'
+# An 'lru' page cache is private to each worker, so an edit would only
+# invalidate the copy of the worker that handled it.
+os.environ.setdefault('CACHE_BACKEND', 'shared')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ['CACHE_BACKEND'] == 'lru' and workers > 1:
+    raise RuntimeError('CACHE_BACKEND=lru keeps a page cache per worker; '
+                       'use shared or none with more than one worker')
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+preload_app = os.environ.get('WEB_PRELOAD', '1') == '1'
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+accesslog = '-'
+
+def when_ready(server):
+    # Objects created while preloading are left out of garbage collection,
+    # which would otherwise write to their pages and unshare them.
+    gc.freeze()
+
+def post_fork(server, worker):
+    from models import app, db
+    from app import start_background_jobs
+    # Pooled connections opened in the master stay with the master.
+    with app.app_context():
+        db.engine.dispose(close=False)
+        db.dispose_replicas(close=False)
+    start_background_jobs()
+
+def worker_exit(server, worker):
+    from models import app, db
+    with app.app_context():
+        db.engine.dispose()
+        db.dispose_replicas()
@@ -0,0 +1,315 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import click
+from flask import abort, redirect, send_file, url_for
+from flask.cli import AppGroup
+from jobs import job_queue
+from models import app, db, Venue, Artist
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+#----------------------------------------------------------------------------#
+# Images.
+#----------------------------------------------------------------------------#
+
+# Venue and artist image_links are fetched once, in a background job, and
+# shrunk to a fixed-size JPEG thumbnail. Thumbnails are stored under their
+# content hash in IMAGES_CACHE_DIR, evicted least recently used first once
+# the cache outgrows IMAGES_CACHE_MAX_BYTES, and served from
+# /images/<venues|artists>/<id>.jpg?v=<link hash>: the URL changes with
+# the link, so responses are immutable. Until its thumbnail exists a URL
+# redirects to the original image. Without Pillow installed thumbnail_url()
+# returns the original links.
+
+OWNERS = {
+    'venues': Venue,
+    'artists': Artist,
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+class ImageError(Exception):
+    pass
+
+def link_key(link):
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()
+
+def enabled():
+    return Image is not None
+
+def thumbnail_url(kind, entity_id, link):
+    if not link or not enabled():
+        return link
+    return url_for('image_thumbnail', kind=kind, entity_id=entity_id, v=link_key(link))
+
+app.jinja_env.globals.update(thumbnail_url=thumbnail_url)
+
+#  Cache
+#  ----------------------------------------------------------------
+
+class ThumbnailCache:
+    # Blobs live in <root>/<2 hex>/<sha256>.jpg; a SQLite index shared by the
+    # processes of the host maps link hashes to blobs and tracks blob use.
+    def __init__(self, root, max_bytes, retry_after):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after
+        os.makedirs(root, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript('''
+            CREATE TABLE IF NOT EXISTS links (key TEXT PRIMARY KEY, link TEXT, digest TEXT, status TEXT, checked_at REAL);
+            CREATE INDEX IF NOT EXISTS ix_links_digest ON links (digest);
+            CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER, used_at REAL);
+            CREATE INDEX IF NOT EXISTS ix_blobs_used_at ON blobs (used_at);
+        ''')
+
+    def _connection(self):
+        if getattr(self._local, 'pid', os.getpid()) != os.getpid():
+            self._local = threading.local()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], f'{digest}.jpg')
+
+    def lookup(self, key):
+        # The blob path for `key`, marking it used at most once a minute.
+        row = self._connection().execute(
+            'SELECT links.digest, blobs.used_at FROM links JOIN blobs ON blobs.digest = links.digest '
+            'WHERE links.key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time() - 60:
+            self._connection().execute('UPDATE blobs SET used_at = ? WHERE digest = ?', (time.time(), row[0]))
+        return self.path(row[0])
+
+    def claim(self, key, link):
+        # True when the caller should fetch `link`: it was never tried, or
+        # its last attempt is older than `retry_after`.
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT status, checked_at FROM links WHERE key = ?', (key,)).fetchone()
+            if row is not None and (row[0] == 'ready' or row[1] > time.time() - self.retry_after):
+                return False
+            connection.execute('INSERT OR REPLACE INTO links (key, link, digest, status, checked_at) '
+                               'VALUES (?, ?, NULL, ?, ?)', (key, link, 'pending', time.time()))
+        return True
+
+    def store(self, key, link, thumbnail):
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.{os.getpid()}.{threading.get_ident()}'
+            with open(partial, 'wb') as target:
+                target.write(thumbnail)
+            os.replace(partial, path)
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('INSERT OR REPLACE INTO blobs (digest, size, used_at) VALUES (?, ?, ?)',
+                               (digest, len(thumbnail), time.time()))
+            connection.execute('INSERT OR REPLACE INTO links (key, link, digest, status, checked_at) '
+                               'VALUES (?, ?, ?, ?, ?)', (key, link, digest, 'ready', time.time()))
+        self.evict()
+        return digest
+
+    def failed(self, key, link):
+        self._connection().execute('INSERT OR REPLACE INTO links (key, link, digest, status, checked_at) '
+                                   'VALUES (?, ?, NULL, ?, ?)', (key, link, 'failed', time.time()))
+
+    def evict(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            total = connection.execute('SELECT coalesce(sum(size), 0) FROM blobs').fetchone()[0]
+            evicted = []
+            for digest, size in connection.execute('SELECT digest, size FROM blobs ORDER BY used_at').fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append(digest)
+                total -= size
+            for digest in evicted:
+                connection.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                connection.execute('DELETE FROM links WHERE digest = ?', (digest,))
+        for digest in evicted:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+        return len(evicted)
+
+    def stats(self):
+        count, size = self._connection().execute('SELECT count(*), coalesce(sum(size), 0) FROM blobs').fetchone()
+        return {"thumbnails": count, "bytes": size, "max_bytes": self.max_bytes}
+
+thumbnail_cache = ThumbnailCache(app.config['IMAGES_CACHE_DIR'], app.config['IMAGES_CACHE_MAX_BYTES'],
+                                 app.config['IMAGES_RETRY_AFTER']) if enabled() else None
+
+#  Fetching
+#  ----------------------------------------------------------------
+
+def public_address(host, port):
+    # The address to connect to for `host`, provided every address it
+    # resolves to is public.
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ImageError(f'Unknown host: {host}')
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0].split('%')[0]).is_global:
+            raise ImageError(f'Not a public address: {host}')
+    return infos[0][4][0]
+
+def check_url(link):
+    # image_links come from visitors: only http(s) URLs on public
+    # addresses are fetched, unless IMAGES_ALLOW_PRIVATE is set (local
+    # stand-ins).
+    parts = urllib.parse.urlsplit(link)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageError(f'Not an http(s) URL: {link}')
+    if not app.config['IMAGES_ALLOW_PRIVATE']:
+        public_address(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+
+class _PinnedConnection:
+    # Connects to the address public_address() checked rather than looking
+    # the host up again, which a short-lived DNS record could point
+    # somewhere private in between. The Host header and the TLS server name
+    # still carry the host name.
+    def connect(self):
+        if not app.config['IMAGES_ALLOW_PRIVATE']:
+            address = public_address(self.host, self.port)
+            self._create_connection = lambda _, *args: socket.create_connection((address, self.port), *args)
+        super().connect()
+
+class _PinnedHTTPConnection(_PinnedConnection, http.client.HTTPConnection):
+    pass
+
+class _PinnedHTTPSConnection(_PinnedConnection, http.client.HTTPSConnection):
+    pass
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PinnedHTTPConnection, req)
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PinnedHTTPSConnection, req, context=self._context)
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+# No proxies: a proxy would resolve the host name itself.
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _PinnedHTTPHandler,
+                                      _PinnedHTTPSHandler, _CheckedRedirects)
+
+def fetch(link):
+    check_url(link)
+    limit = app.config['IMAGES_MAX_BYTES']
+    request = urllib.request.Request(link, headers={'User-Agent': 'Fyyur thumbnailer'})
+    try:
+        with _opener.open(request, timeout=app.config['IMAGES_FETCH_TIMEOUT']) as response:
+            if not response.headers.get_content_type().startswith('image/'):
+                raise ImageError(f'Not an image: {response.headers.get_content_type()}')
+            data = response.read(limit + 1)
+    except urllib.error.HTTPError as error:
+        if error.code < 500:
+            raise ImageError(f'HTTP {error.code}')
+        raise
+    if len(data) > limit:
+        raise ImageError(f'Larger than {limit} bytes')
+    return data
+
+def make_thumbnail(data):
+    size = tuple(int(side) for side in app.config['IMAGES_THUMBNAIL_SIZE'].split('x'))
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft('RGB', size)
+        thumbnail = ImageOps.fit(ImageOps.exif_transpose(image).convert('RGB'), size, Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageError(f'Unreadable image: {error}')
+    output = io.BytesIO()
+    thumbnail.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+def refresh_thumbnail(link):
+    # Body of the fetch_image job. Links that are not usable images are
+    # recorded as failed; network and server errors propagate so that the
+    # job is retried.
+    key = link_key(link)
+    try:
+        thumbnail_cache.store(key, link, make_thumbnail(fetch(link)))
+    except ImageError as error:
+        app.logger.info('Image %s skipped: %s', link, error)
+        thumbnail_cache.failed(key, link)
+
+def request_thumbnail(link):
+    # Call after committing a new or changed image_link.
+    if link and enabled() and thumbnail_cache.claim(link_key(link), link):
+        job_queue.enqueue('fetch_image', link)
+
+#  Serving
+#  ----------------------------------------------------------------
+
+def thumbnail_response(kind, entity_id, version):
+    # Only the thumbnail of the entity's current link is served under its
+    # URL, not any cached image whose link hash is passed as `v`.
+    model = OWNERS[kind]
+    link = db.session.query(model.image_link).filter(model.id == entity_id).scalar()
+    if not link:
+        abort(404)
+    if version != link_key(link):
+        return redirect(thumbnail_url(kind, entity_id, link))
+
+    path = thumbnail_cache.lookup(version)
+    if path is not None and os.path.exists(path):
+        response = send_file(path, mimetype='image/jpeg', conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+    request_thumbnail(link)
+    response = redirect(link)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+images_cli = AppGroup('images', help='Manage image thumbnails.')
+
+@images_cli.command('fetch')
+def fetch_command():
+    """Fetch the thumbnails of every venue and artist image missing from the cache."""
+    if not enabled():
+        raise click.ClickException('Pillow is not installed.')
+    links = {link for model in OWNERS.values()
+             for link, in db.session.query(model.image_link).filter(model.image_link.isnot(None)).distinct()}
+    fetched = 0
+    for link in links:
+        if link and thumbnail_cache.claim(link_key(link), link):
+            refresh_thumbnail(link)
+            fetched += 1
+    click.echo(f'{fetched} of {len(links)} images fetched; {thumbnail_cache.stats()}')
+
+app.cli.add_command(images_cli)
@@ -0,0 +1,228 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from models import app, db
+from pool_metrics import latency_summary
+
+#----------------------------------------------------------------------------#
+# Job queue.
+#----------------------------------------------------------------------------#
+
+# Work that does not have to finish before the response, and gives the
+# same result whichever process runs it (image fetches), is enqueued by the
+# submission handlers once their commit succeeded, and run by a pool of
+# JOBS_WORKERS threads. With the sqlite backend any process of the host may
+# claim a job, so per-process state (the LRU page cache, the search and
+# typeahead indexes) is never updated from a job. A job is a registered
+# name and JSON arguments; one that raises is retried up to
+# JOBS_MAX_ATTEMPTS times, JOBS_RETRY_DELAY seconds later and twice as long
+# at every attempt. Before start() is called (CLI commands, JOBS_WORKERS=0),
+# and while the queue is full, enqueue() runs the job right away instead.
+
+class MemoryBackend:
+    # In-process queue; jobs still waiting are lost when the process exits.
+    def __init__(self, max_size):
+        self._queue = queue.Queue(max_size)
+
+    def put(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def retry(self, job, delay):
+        timer = threading.Timer(delay, self._queue.put, [job])
+        timer.daemon = True
+        timer.start()
+
+    def done(self, job):
+        pass
+
+    def __len__(self):
+        return self._queue.qsize()
+
+class SQLiteBackend:
+    # Durable queue in a SQLite file shared by the processes of one host.
+    # Jobs survive restarts, and a job claimed by a process that died is
+    # handed out again after `claim_timeout` seconds.
+    def __init__(self, path, max_size, claim_timeout=300, poll_interval=0.5):
+        self.path = path
+        self.max_size = max_size
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._connection().executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, name TEXT, args TEXT, attempts INTEGER,
+                                             enqueued_at REAL, run_after REAL, claimed_at REAL);
+            CREATE INDEX IF NOT EXISTS ix_jobs_run_after ON jobs (run_after);
+        ''')
+
+    def _connection(self):
+        if getattr(self._local, 'pid', os.getpid()) != os.getpid():
+            self._local = threading.local()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def put(self, job):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if connection.execute('SELECT count(*) FROM jobs').fetchone()[0] >= self.max_size:
+                return False
+            connection.execute('INSERT INTO jobs (name, args, attempts, enqueued_at, run_after) VALUES (?, ?, ?, ?, ?)',
+                               (job['name'], json.dumps(job['args']), job['attempts'], job['enqueued_at'],
+                                job['enqueued_at']))
+        self._wakeup.set()
+        return True
+
+    def get(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            job = self._claim()
+            if job is not None or time.time() >= deadline:
+                return job
+            self._wakeup.wait(min(self.poll_interval, max(deadline - time.time(), 0)))
+            self._wakeup.clear()
+
+    def _claim(self):
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT id, name, args, attempts, enqueued_at FROM jobs '
+                'WHERE run_after <= ? AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY run_after, id LIMIT 1',
+                (now, now - self.claim_timeout)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE jobs SET claimed_at = ? WHERE id = ?', (now, row[0]))
+        return {"id": row[0], "name": row[1], "args": json.loads(row[2]), "attempts": row[3], "enqueued_at": row[4]}
+
+    def retry(self, job, delay):
+        self._connection().execute('UPDATE jobs SET attempts = ?, run_after = ?, claimed_at = NULL WHERE id = ?',
+                                   (job['attempts'], time.time() + delay, job['id']))
+
+    def done(self, job):
+        self._connection().execute('DELETE FROM jobs WHERE id = ?', (job['id'],))
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM jobs').fetchone()[0]
+
+class JobQueue:
+    def __init__(self, backend, max_attempts, retry_delay, samples=1000):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.handlers = {}
+        self.workers = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.ran_inline = 0
+        self.wait_time = deque(maxlen=samples)
+        self.run_time = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def job(self, name):
+        def decorator(handler):
+            self.handlers[name] = handler
+            return handler
+        return decorator
+
+    def enqueue(self, name, *args):
+        job = {"id": None, "name": name, "args": list(args), "attempts": 0, "enqueued_at": time.time()}
+        if not self.workers or not self.backend.put(job):
+            with self._lock:
+                self.ran_inline += 1
+            self._run(job, queued=False)
+
+    def start(self, workers):
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name=f'jobs-{number}', daemon=True)
+            thread.start()
+            self.workers.append(thread)
+
+    def _work(self):
+        while True:
+            job = self.backend.get(timeout=1)
+            if job is None:
+                continue
+            with app.app_context():
+                try:
+                    self._run(job)
+                finally:
+                    db.session.remove()
+
+    def _run(self, job, queued=True):
+        started = time.time()
+        with self._lock:
+            self.wait_time.append(started - job['enqueued_at'])
+            self.running += 1
+        try:
+            self.handlers[job['name']](*job['args'])
+        except Exception:
+            db.session.rollback()
+            job['attempts'] += 1
+            if queued and job['attempts'] < self.max_attempts:
+                app.logger.warning('Job %s failed (attempt %d), retrying', job['name'], job['attempts'], exc_info=True)
+                self.backend.retry(job, self.retry_delay * 2 ** (job['attempts'] - 1))
+                with self._lock:
+                    self.retried += 1
+            else:
+                app.logger.exception('Job %s failed', job['name'])
+                if queued:
+                    self.backend.done(job)
+                with self._lock:
+                    self.failed += 1
+        else:
+            if queued:
+                self.backend.done(job)
+            with self._lock:
+                self.completed += 1
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_time.append(time.time() - started)
+
+    def stats(self):
+        with self._lock:
+            wait = list(self.wait_time)
+            run = list(self.run_time)
+            stats = {
+                "backend": type(self.backend).__name__,
+                "workers": len(self.workers),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retried": self.retried,
+                "ran_inline": self.ran_inline
+            }
+        stats["depth"] = len(self.backend)
+        stats["wait_time"] = latency_summary(wait)
+        stats["run_time"] = latency_summary(run)
+        return stats
+
+def _backend(config):
+    if config['JOBS_BACKEND'] == 'sqlite':
+        return SQLiteBackend(config['JOBS_SQLITE_PATH'], config['JOBS_MAX_QUEUE'])
+    return MemoryBackend(config['JOBS_MAX_QUEUE'])
+
+job_queue = JobQueue(_backend(app.config), app.config['JOBS_MAX_ATTEMPTS'], app.config['JOBS_RETRY_DELAY'])
@@ -0,0 +1,46 @@
+"""upcoming show counters
+
+Revision ID: 4c1e9a7d2b60
+Revises: 0793e47f077f
+Create Date: 2026-10-18 09:12:04.381220
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e9a7d2b60'
+down_revision = '0793e47f077f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('CounterWatermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index(op.f('ix_Show_start_time'), 'Show', ['start_time'], unique=False)
+
+    # Seed the counters so that roll-forwards start from a correct baseline.
+    now = datetime.now()
+    bind = op.get_bind()
+    bind.execute(sa.text(
+        'INSERT INTO "CounterWatermark" (name, rolled_at) VALUES (\'upcoming_shows\', :now)'
+    ), now=now)
+    bind.execute(sa.text(
+        'UPDATE "Venue" SET num_upcoming_shows = (SELECT count(*) FROM "Show" '
+        'WHERE "Show".venue_id = "Venue".id AND "Show".start_time > :now)'
+    ), now=now)
+    bind.execute(sa.text(
+        'UPDATE "Artist" SET num_upcoming_shows = (SELECT count(*) FROM "Show" '
+        'WHERE "Show".artist_id = "Artist".id AND "Show".start_time > :now)'
+    ), now=now)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Show_start_time'), table_name='Show')
+    op.drop_table('CounterWatermark')
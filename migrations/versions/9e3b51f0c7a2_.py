@@ -0,0 +1,30 @@
+"""trigram search indexes
+
+Revision ID: 9e3b51f0c7a2
+Revises: 4c1e9a7d2b60
+Create Date: 2026-10-18 10:02:47.115930
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b51f0c7a2'
+down_revision = '4c1e9a7d2b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Venue_city_trgm', 'Venue', ['city'], unique=False, postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+    op.create_index('ix_Venue_state_trgm', 'Venue', ['state'], unique=False, postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_state_trgm', table_name='Venue')
+    op.drop_index('ix_Venue_city_trgm', table_name='Venue')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
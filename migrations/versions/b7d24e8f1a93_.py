@@ -0,0 +1,82 @@
+"""normalized genres
+
+Revision ID: b7d24e8f1a93
+Revises: 9e3b51f0c7a2
+Create Date: 2026-10-18 11:26:38.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d24e8f1a93'
+down_revision = '9e3b51f0c7a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), nullable=False),
+    sa.Column('artist_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id_venue_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id_artist_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    # Split the existing comma-joined genre strings into the new tables.
+    bind = op.get_bind()
+    genre_ids = {}
+    counts = {}
+    links = {}
+    for table, link_table, owner_column, count_column in (
+            ('Venue', 'venue_genres', 'venue_id', 'venue_count'),
+            ('Artist', 'artist_genres', 'artist_id', 'artist_count')):
+        links[(link_table, owner_column)] = rows = []
+        for owner_id, value in bind.execute(sa.text(f'SELECT id, genres FROM "{table}"')):
+            names = {name.strip() for name in (value or '').split(',') if name.strip()}
+            for name in names:
+                genre_id = genre_ids.setdefault(name, len(genre_ids) + 1)
+                counts.setdefault(name, {'venue_count': 0, 'artist_count': 0})[count_column] += 1
+                rows.append({'owner_id': owner_id, 'genre_id': genre_id})
+
+    if not genre_ids:
+        return
+    bind.execute(sa.text(
+        'INSERT INTO "Genre" (id, name, venue_count, artist_count) '
+        'VALUES (:id, :name, :venue_count, :artist_count)'
+    ), [dict(counts[name], id=genre_id, name=name) for name, genre_id in genre_ids.items()])
+    bind.execute(sa.text(
+        'SELECT setval(pg_get_serial_sequence(\'"Genre"\', \'id\'), (SELECT max(id) FROM "Genre"))'
+    ))
+    for (link_table, owner_column), rows in links.items():
+        if rows:
+            bind.execute(sa.text(
+                f'INSERT INTO "{link_table}" ({owner_column}, genre_id) VALUES (:owner_id, :genre_id)'
+            ), rows)
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres_genre_id_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id_venue_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
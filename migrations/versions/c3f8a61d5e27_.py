@@ -0,0 +1,36 @@
+"""updated_at columns
+
+Revision ID: c3f8a61d5e27
+Revises: b7d24e8f1a93
+Create Date: 2026-10-18 14:02:51.227406
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a61d5e27'
+down_revision = 'b7d24e8f1a93'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    # Existing rows are stamped with the migration time.
+    now = datetime.utcnow()
+    bind = op.get_bind()
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        bind.execute(sa.text(f'UPDATE "{table}" SET updated_at = :now'), now=now)
+        op.alter_column(table, 'updated_at', nullable=False)
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
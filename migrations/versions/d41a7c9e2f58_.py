@@ -0,0 +1,57 @@
+"""show durations and booking constraints
+
+Revision ID: d41a7c9e2f58
+Revises: c3f8a61d5e27
+Create Date: 2026-10-18 16:40:12.518093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7c9e2f58'
+down_revision = 'c3f8a61d5e27'
+branch_labels = None
+depends_on = None
+
+OWNERS = ('venue_id', 'artist_id')
+
+# Shows starting before an earlier show of the same owner has ended.
+OVERLAPS = '''
+SELECT id FROM (
+    SELECT id, start_time, max(start_time + duration * interval '1 minute') OVER (
+        PARTITION BY {owner} ORDER BY start_time, id
+        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS busy_until
+    FROM "Show") AS shows
+WHERE start_time < busy_until
+ORDER BY id LIMIT 20
+'''
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration', sa.Integer(), nullable=False, server_default='120'))
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    for owner in OWNERS:
+        overlapping = [row[0] for row in bind.execute(sa.text(OVERLAPS.format(owner=owner)))]
+        if overlapping:
+            raise RuntimeError(f'Shows {overlapping} overlap other shows with the same {owner}; '
+                               'move or delete them before upgrading')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for owner in OWNERS:
+        op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{owner}_no_overlap" EXCLUDE USING gist '
+                   f'({owner} WITH =, tsrange(start_time, start_time + duration * interval \'1 minute\') WITH &&)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for owner in OWNERS:
+            op.execute(f'ALTER TABLE "Show" DROP CONSTRAINT "Show_{owner}_no_overlap"')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_column('Show', 'duration')
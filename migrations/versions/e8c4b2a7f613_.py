@@ -0,0 +1,38 @@
+"""city calendar summary
+
+Revision ID: e8c4b2a7f613
+Revises: d41a7c9e2f58
+Create Date: 2026-10-18 18:21:37.604115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b2a7f613'
+down_revision = 'd41a7c9e2f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by the first `flask calendar refresh` (or the in-process job).
+    op.create_table('CityDay',
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.Column('shows', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'city', 'day')
+    )
+    op.create_table('CityCalendarDirty',
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'city')
+    )
+
+
+def downgrade():
+    op.drop_table('CityCalendarDirty')
+    op.drop_table('CityDay')
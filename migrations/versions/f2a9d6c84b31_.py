@@ -0,0 +1,34 @@
+"""listing and show paging indexes
+
+Revision ID: f2a9d6c84b31
+Revises: e8c4b2a7f613
+Create Date: 2026-10-18 20:34:51.226407
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9d6c84b31'
+down_revision = 'e8c4b2a7f613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /venues reads venues in (state, city, name, id) order and /artists in
+    # (name, id) order; on PostgreSQL both are index-only scans.
+    op.create_index('ix_Venue_state_city_name', 'Venue', ['state', 'city', 'name', 'id'], unique=False,
+                    postgresql_include=['num_upcoming_shows'])
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    # Keyset pages of /shows and the API; replaces the start_time index,
+    # which it prefixes.
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.drop_index('ix_Show_start_time', table_name='Show')
+
+
+def downgrade():
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Venue_state_city_name', table_name='Venue')
@@ -1,10 +1,15 @@
 import json
+from datetime import datetime
+from functools import lru_cache
 import dateutil.parser
 import babel
+import babel.dates
+from babel import Locale
 from flask import Flask
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from pool_metrics import pool_options
+from replicas import RoutingSQLAlchemy
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -12,11 +17,50 @@ from flask_migrate import Migrate
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                       app.config['SQLALCHEMY_ENGINE_OPTIONS'], 'primary')
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app,db)
 
+# Genres are stored once in Genre and linked through these association
+# tables; the (genre_id, owner) indexes serve the genre-filtered listings.
+# venue_count and artist_count are the facet counts shown on the listing
+# pages, kept up to date by genres.py.
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+    venue_count = db.Column(db.Integer, nullable=False, default=0)
+    artist_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+       return f"<Genre id={self.id} name={self.name}>"
+
+# updated_at is kept in UTC by the column default/onupdate, so every ORM or
+# Core insert and update bumps it; it backs the page validators and
+# incremental exports.
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_state_trgm', 'state', postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_state_city_name', 'state', 'city', 'name', 'id', postgresql_include=['num_upcoming_shows']),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -33,13 +77,19 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
     num_upcoming_shows = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     show = db.relationship('Show', backref='venues', lazy=True)
+    genre_items = db.relationship('Genre', secondary=venue_genres, lazy=True)
 
     def __repr__(self):
        return f"<Venue id={self.id} name={self.name} city={self.city} state={self.state}>"
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -54,34 +104,103 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
     num_upcoming_shows = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     show = db.relationship('Show', backref="artists", lazy=True)
+    genre_items = db.relationship('Genre', secondary=artist_genres, lazy=True)
 
     def __repr__(self):
        return f"<Artist id={self.id} name={self.name} city={self.city} state={self.state}>"
 
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+# A show books its venue and its artist for `duration` minutes from
+# start_time. On PostgreSQL exclusion constraints reject overlapping
+# bookings (see migration d41a7c9e2f58 and bookings.py).
+DEFAULT_SHOW_DURATION = 120
+
 class Show(db.Model):
   __tablename__ = 'Show'
+  __table_args__ = (
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+  )
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False)
+  duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION,
+                       server_default=str(DEFAULT_SHOW_DURATION))
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
   def __repr__(self):
     return f"<Show id={self.id} artist_id={self.artist_id} venue_id={self.venue_id}>"
 
 
+# Point in time up to which the num_upcoming_shows counters have been rolled
+# forward; shows starting after it are counted as upcoming.
+class CounterWatermark(db.Model):
+  __tablename__ = 'CounterWatermark'
+  name = db.Column(db.String(50), primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+  def __repr__(self):
+    return f"<CounterWatermark name={self.name} rolled_at={self.rolled_at}>"
+
+
+# Upcoming shows per city and day, maintained by city_calendar.py: the
+# number of shows and the first few of them (JSON) for each day of the
+# calendar horizon. Cities whose rows have to be recomputed for reasons
+# updated_at cannot show (a venue moving or being deleted) are queued in
+# CityCalendarDirty.
+class CityDay(db.Model):
+  __tablename__ = 'CityDay'
+  state = db.Column(db.String(120), primary_key=True)
+  city = db.Column(db.String(120), primary_key=True)
+  day = db.Column(db.Date, primary_key=True)
+  show_count = db.Column(db.Integer, nullable=False)
+  shows = db.Column(db.Text, nullable=False)
+
+  def __repr__(self):
+    return f"<CityDay state={self.state} city={self.city} day={self.day} show_count={self.show_count}>"
+
+class CityCalendarDirty(db.Model):
+  __tablename__ = 'CityCalendarDirty'
+  state = db.Column(db.String(120), primary_key=True)
+  city = db.Column(db.String(120), primary_key=True)
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  # Resolving the locale and compiling the pattern is the costly part of
+  # babel's format_datetime, so it is done once per (format, locale).
+  return Locale.parse(locale), babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+def format_datetime(value, format='medium', locale='en'):
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  locale, pattern = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
+
+def format_datetimes(values, format='medium', locale='en'):
+  # Formats a whole list at once: the pattern is looked up a single time and
+  # repeated values are formatted only once.
+  locale, pattern = datetime_pattern(format, locale)
+  formatted = {}
+  result = []
+  for value in values:
+    if value not in formatted:
+      formatted[value] = pattern.apply(value, locale)
+    result.append(formatted[value])
+  return result
 
 app.jinja_env.filters['datetime'] = format_datetime
\ No newline at end of file
@@ -0,0 +1,126 @@
+import threading
+import time
+import weakref
+from collections import deque
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool metrics.
+#----------------------------------------------------------------------------#
+
+def latency_summary(samples):
+    if not samples:
+        return {"avg_ms": 0, "p50_ms": 0, "p99_ms": 0, "max_ms": 0}
+    ordered = sorted(samples)
+    return {
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+class PoolStats:
+    def __init__(self, samples=1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.overflow_events = 0
+        self.checkout_latency = deque(maxlen=samples)
+        self.wait_time = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.pools = weakref.WeakKeyDictionary()
+
+    def add_pool(self, pool, name):
+        with self._lock:
+            self.pools[pool] = name
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = self.timeouts = self.overflow_events = 0
+            self.checkout_latency.clear()
+            self.wait_time.clear()
+
+    def record_wait(self, seconds, timed_out, overflowed):
+        with self._lock:
+            self.wait_time.append(seconds)
+            if timed_out:
+                self.timeouts += 1
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_latency.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            latency = list(self.checkout_latency)
+            wait = list(self.wait_time)
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "overflow_events": self.overflow_events
+            }
+            pools = list(self.pools.items())
+        # Engines disposed since (gunicorn's post_fork) leave their old pools
+        # behind until they are collected; only the newest pool per name counts.
+        current = {name: pool for pool, name in pools}
+        stats["pools"] = {name: {
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0)
+        } for name, pool in current.items()}
+        for field in ("size", "in_use", "idle", "overflow"):
+            stats[field] = sum(pool[field] for pool in stats["pools"].values())
+        stats["checkout_latency"] = latency_summary(latency)
+        stats["wait_time"] = latency_summary(wait)
+        return stats
+
+pool_stats = PoolStats()
+
+def pool_options(uri, options, name):
+    # Engine options for `uri` with an instrumented pool reported as `name`.
+    # In-memory SQLite keeps Flask-SQLAlchemy's StaticPool, which takes no
+    # sizing options.
+    options = {key: value for key, value in options.items() if key != 'poolclass'}
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(option, None)
+        return options
+    if url.get_backend_name() == 'sqlite':
+        # The pool hands each connection to one thread at a time.
+        options['connect_args'] = {'check_same_thread': False, **options.get('connect_args', {})}
+    options['poolclass'] = type('InstrumentedQueuePool', (InstrumentedQueuePool,), {'pool_name': name})
+    return options
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that times every checkout. `wait_time` covers getting a
+    # connection out of the queue (or opening an overflow one), while
+    # `checkout_latency` also includes pre-ping and checkout events.
+    pool_name = 'primary'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_stats.add_pool(self, self.pool_name)
+
+    def connect(self):
+        started = time.perf_counter()
+        connection = super().connect()
+        pool_stats.record_checkout(time.perf_counter() - started)
+        return connection
+
+    def _do_get(self):
+        overflow = self.overflow()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_wait(time.perf_counter() - started, True, False)
+            raise
+        pool_stats.record_wait(time.perf_counter() - started, False,
+                               self.overflow() > max(overflow, 0))
+        return connection
@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# SQL profiler.
+#----------------------------------------------------------------------------#
+
+# Hooks the engines' cursor events to record, per request, how many
+# statements ran, the time spent in the database, the slowest statements and
+# statements repeated with different parameters (the usual sign of an N+1
+# lazy load). Enabled with SQL_PROFILER; results go out in X-Query-Count and
+# X-DB-Time headers and the last requests are kept for /debug/queries.
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def _shape(statement):
+    return ' '.join(_literals.sub('?', statement).split())
+
+class RequestProfile:
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = []
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.db_time += seconds
+        self.statements.append((seconds, statement))
+        self.shapes[_shape(statement)] += 1
+
+    def report(self, slowest=5, repeat_threshold=5):
+        return {
+            "query_count": self.count,
+            "db_time_ms": round(self.db_time * 1000, 3),
+            "slowest": [{"ms": round(seconds * 1000, 3), "statement": statement}
+                        for seconds, statement in sorted(self.statements, key=lambda item: -item[0])[:slowest]],
+            "repeated": [{"count": count, "statement": shape}
+                         for shape, count in self.shapes.most_common() if count >= repeat_threshold]
+        }
+
+class QueryProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.history = deque()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['SQL_PROFILER']
+        if self.enabled:
+            self.history = deque(maxlen=app.config['SQL_PROFILER_HISTORY'])
+            self._attach()
+            app.before_request(self._start)
+            app.after_request(self._finish)
+
+    def _attach(self):
+        if not event.contains(Engine, 'before_cursor_execute', self._before):
+            event.listen(Engine, 'before_cursor_execute', self._before)
+            event.listen(Engine, 'after_cursor_execute', self._after)
+            event.listen(Engine, 'handle_error', self._failed)
+
+    def _profiles(self):
+        # The request's profile plus any open query_budget() scopes.
+        profiles = list(getattr(self._local, 'budgets', ()))
+        if has_request_context() and 'sql_profile' in g:
+            profiles.append(g.sql_profile)
+        return profiles
+
+    # Start times are kept per execution context: a statement that raises
+    # gets no after_cursor_execute, only handle_error.
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', {})[context] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['profiler_started'].pop(context)
+        for profile in self._profiles():
+            profile.record(statement, seconds)
+
+    def _failed(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None:
+            connection.info.get('profiler_started', {}).pop(exception_context.execution_context, None)
+
+    def _start(self):
+        g.sql_profile = RequestProfile()
+
+    def _finish(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        response.headers['X-Query-Count'] = str(profile.count)
+        response.headers['X-DB-Time'] = f"{profile.db_time * 1000:.3f}ms"
+        report = profile.report(repeat_threshold=self.app.config['SQL_PROFILER_REPEAT_THRESHOLD'])
+        report.update({"method": request.method, "path": request.full_path, "status": response.status_code})
+        with self._lock:
+            self.history.append(report)
+        return response
+
+    def reports(self):
+        with self._lock:
+            return list(self.history)
+
+    @contextmanager
+    def query_budget(self, budget):
+        # Test helper: fails when the statements run inside the block,
+        # including those of test client requests, exceed `budget`.
+        self._attach()
+        profile = RequestProfile()
+        budgets = self._local.__dict__.setdefault('budgets', [])
+        budgets.append(profile)
+        try:
+            yield profile
+        finally:
+            budgets.remove(profile)
+        if profile.count > budget:
+            report = profile.report(repeat_threshold=2)
+            raise AssertionError(
+                f"{profile.count} queries exceed the budget of {budget}; repeated: {report['repeated']}")
+
+profiler = QueryProfiler()
@@ -0,0 +1,324 @@
+from datetime import datetime, timezone
+from itertools import groupby
+from sqlalchemy import case, func, tuple_
+from models import app, db, Venue, Artist, Show
+from genres import venues_with_genre, artists_with_genre, venue_facets_query, artist_facets_query
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# Page data is described as plans: the list of queries a page needs and a
+# function building the result from their rows. run() executes the
+# queries one after the other on the request's session; asgi.py runs the
+# same plans on an async engine, each query on its own connection,
+# concurrently.
+
+def run(plan):
+    queries, finish = plan
+    return finish(*[query.all() for query in queries])
+
+def combine(*plans, finish=lambda *results: results):
+    queries = [query for plan_queries, _ in plans for query in plan_queries]
+
+    def finish_all(*rows):
+        results = []
+        for plan_queries, plan_finish in plans:
+            results.append(plan_finish(*rows[:len(plan_queries)]))
+            rows = rows[len(plan_queries):]
+        return finish(*results)
+    return queries, finish_all
+
+def _dicts(rows):
+    return [row._asdict() for row in rows]
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+def _areas(rows):
+    areas = []
+    for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        areas.append({
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": venue.num_upcoming_shows
+            } for venue in venues]
+        })
+    return areas
+
+def venue_areas_plan(genre=None):
+    # One round trip for the whole /venues listing: venues come back ordered
+    # by area, with the maintained upcoming show counter (see counters.py),
+    # and are grouped into areas in a single pass.
+    venues = db.session.query(
+        Venue.state,
+        Venue.city,
+        Venue.id,
+        Venue.name,
+        Venue.num_upcoming_shows
+    )
+    if genre:
+        venues = venues.filter(Venue.id.in_(venues_with_genre(genre)))
+    return [venues.order_by(Venue.state, Venue.city, Venue.name, Venue.id)], _areas
+
+def venues_listing_plan(genre=None):
+    return combine(
+        venue_areas_plan(genre),
+        ([venue_facets_query()], _dicts),
+        finish=lambda areas, facets: {"areas": areas, "facets": facets}
+    )
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+def artist_list_plan(genre=None):
+    artists = db.session.query(Artist.id, Artist.name)
+    if genre:
+        artists = artists.filter(Artist.id.in_(artists_with_genre(genre)))
+    return [artists.order_by(Artist.name, Artist.id)], _dicts
+
+def artists_listing_plan(genre=None):
+    return combine(
+        artist_list_plan(genre),
+        ([artist_facets_query()], _dicts),
+        finish=lambda artists, facets: {"artists": artists, "facets": facets}
+    )
+
+
+#  Show timelines
+#  ----------------------------------------------------------------
+
+def _timeline_plan(shows, owner_column, owner_id, now, limit):
+    # Past and upcoming shows are split in SQL, each side ordered towards the
+    # present and capped at `limit` rows.
+    counts = db.session.query(
+        func.count(case([(Show.start_time > now, 1)])).label('upcoming'),
+        func.count(case([(Show.start_time <= now, 1)])).label('past')
+    ).filter(owner_column == owner_id)
+    upcoming = shows.filter(Show.start_time > now) \
+        .order_by(Show.start_time, Show.id).limit(limit)
+    past = shows.filter(Show.start_time <= now) \
+        .order_by(Show.start_time.desc(), Show.id.desc()).limit(limit)
+
+    def finish(counts, upcoming, past):
+        return {
+            "past_shows": [_show_info(row) for row in past],
+            "upcoming_shows": [_show_info(row) for row in upcoming],
+            "past_shows_count": counts[0].past,
+            "upcoming_shows_count": counts[0].upcoming
+        }
+    return [counts, upcoming, past], finish
+
+def _show_info(row):
+    return row._asdict()
+
+def venue_timeline_plan(venue_id, limit):
+    now = datetime.now()
+    shows = db.session.query(
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ).join(Artist, Show.artist_id == Artist.id).filter(Show.venue_id == venue_id)
+    return _timeline_plan(shows, Show.venue_id, venue_id, now, limit)
+
+def venue_timeline(venue_id, limit):
+    return run(venue_timeline_plan(venue_id, limit))
+
+def artist_timeline_plan(artist_id, limit):
+    now = datetime.now()
+    shows = db.session.query(
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link'),
+        Show.start_time
+    ).join(Venue, Show.venue_id == Venue.id).filter(Show.artist_id == artist_id)
+    return _timeline_plan(shows, Show.artist_id, artist_id, now, limit)
+
+def artist_timeline(artist_id, limit):
+    return run(artist_timeline_plan(artist_id, limit))
+
+
+#  Detail pages
+#  ----------------------------------------------------------------
+
+VENUE_PAGE_FIELDS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website_link',
+                     'facebook_link', 'seeking_talent', 'seeking_description', 'image_link', 'updated_at')
+
+ARTIST_PAGE_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'facebook_link',
+                      'website_link', 'image_link', 'seeking_venue', 'seeking_description', 'updated_at')
+
+def _details_plan(model, fields, entity_id):
+    def finish(rows):
+        if not rows:
+            return None
+        details = rows[0]._asdict()
+        details["genres"] = details["genres"].split(',') if details["genres"] else []
+        return details
+    return [db.session.query(*(getattr(model, field) for field in fields)).filter(model.id == entity_id)], finish
+
+def _page(details, timeline):
+    if details is None:
+        return None
+    details.update(timeline)
+    return details
+
+def venue_page_plan(venue_id, limit):
+    # The venue's columns and its timeline; None when there is no such venue.
+    return combine(_details_plan(Venue, VENUE_PAGE_FIELDS, venue_id),
+                   venue_timeline_plan(venue_id, limit), finish=_page)
+
+def artist_page_plan(artist_id, limit):
+    return combine(_details_plan(Artist, ARTIST_PAGE_FIELDS, artist_id),
+                   artist_timeline_plan(artist_id, limit), finish=_page)
+
+
+#  Shows feed
+#  ----------------------------------------------------------------
+
+def encode_show_cursor(start_time, show_id):
+    return f"{start_time.isoformat()}_{show_id}"
+
+def decode_show_cursor(cursor):
+    start_time, _, show_id = cursor.rpartition('_')
+    return datetime.fromisoformat(start_time), int(show_id)
+
+SHOW_FIELDS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'duration': Show.duration,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'venue_image_link': Venue.image_link,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link
+}
+
+def shows_page_plan(after=None, limit=50, fields=('id', 'start_time', 'venue_id', 'venue_name',
+                                                  'artist_id', 'artist_name', 'artist_image_link')):
+    # Keyset pagination over (start_time, id): every page is an index range
+    # scan that starts right after the last row of the previous page. Only
+    # the requested fields are selected, and Venue or Artist are joined only
+    # when one of their columns is needed; id and start_time always come
+    # back since they make up the cursor.
+    fields = list(dict.fromkeys(('id', 'start_time') + tuple(fields)))
+    shows = db.session.query(*(SHOW_FIELDS[field].label(field) for field in fields)).select_from(Show)
+    if any(field.startswith('venue_') and field != 'venue_id' for field in fields):
+        shows = shows.join(Venue, Show.venue_id == Venue.id)
+    if any(field.startswith('artist_') and field != 'artist_id' for field in fields):
+        shows = shows.join(Artist, Show.artist_id == Artist.id)
+
+    if after is not None:
+        shows = shows.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+
+    def finish(rows):
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+        return [_show_info(row) for row in rows], next_cursor
+    return [shows.order_by(Show.start_time, Show.id).limit(limit + 1)], finish
+
+def shows_page(*args, **kwargs):
+    return run(shows_page_plan(*args, **kwargs))
+
+
+#  Entity pages
+#  ----------------------------------------------------------------
+
+def entity_page(model, fields, after=None, limit=50):
+    # Id-ordered keyset page of `model` selecting only `fields`.
+    fields = list(dict.fromkeys(('id',) + tuple(fields)))
+    rows = db.session.query(*(getattr(model, field) for field in fields))
+    if after is not None:
+        rows = rows.filter(model.id > after)
+    rows = rows.order_by(model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+    return [row._asdict() for row in rows], next_cursor
+
+def entity(model, entity_id, fields):
+    row = db.session.query(*(getattr(model, field) for field in fields)) \
+        .filter(model.id == entity_id).one_or_none()
+    return row._asdict() if row is not None else None
+
+
+#  Page validators
+#  ----------------------------------------------------------------
+
+# Each validator plan reads only aggregates over indexed columns and yields
+# (last_modified, state): `state` is hashed into the page's ETag and
+# last_modified, in UTC, is sent as Last-Modified. Shows crossing from
+# upcoming to past change a page without touching any row, so the detail
+# validators also cover the last show start that has passed.
+
+def _utc(value):
+    # start_time is naive local time; updated_at is naive UTC.
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _validator(row, crossed_at=None):
+    state = tuple(row)
+    stamps = [value for value in state if isinstance(value, datetime)]
+    if crossed_at is not None:
+        stamps.append(_utc(crossed_at))
+    return max(stamps, default=datetime(1970, 1, 1)), state
+
+def _latest(model):
+    return (
+        db.session.query(func.max(model.updated_at)).scalar_subquery(),
+        db.session.query(func.count(model.id)).scalar_subquery()
+    )
+
+def _detail_validator(model, owner_column, other, other_column, owner_id):
+    # Adding or removing a show moves its owners' updated_at (see
+    # counters.py), so the entity's own row covers its shows. The rows shown
+    # for the other side are the ones in the page's two timeline sections,
+    # read like the timeline itself from the (owner, start_time) index, so
+    # the cost follows SHOWS_PER_SECTION, not the entity's history.
+    now = datetime.now()
+    limit = app.config['SHOWS_PER_SECTION']
+    shows = db.session.query(other.updated_at.label('updated_at')).select_from(Show) \
+        .join(other, other_column == other.id).filter(owner_column == owner_id)
+    upcoming = shows.filter(Show.start_time > now).order_by(Show.start_time).limit(limit).subquery()
+    past = shows.filter(Show.start_time <= now).order_by(Show.start_time.desc()).limit(limit).subquery()
+    query = db.session.query(
+        model.updated_at,
+        model.num_upcoming_shows,
+        db.session.query(func.max(upcoming.c.updated_at)).scalar_subquery(),
+        db.session.query(func.max(past.c.updated_at)).scalar_subquery(),
+        db.session.query(func.max(Show.start_time))
+            .filter(owner_column == owner_id, Show.start_time <= now).scalar_subquery()
+    ).filter(model.id == owner_id)
+
+    def finish(rows):
+        if not rows:
+            return None
+        return _validator(rows[0][:4], crossed_at=rows[0][4])
+    return [query], finish
+
+def _listing_validator(*models):
+    columns = [column for model in models for column in _latest(model)]
+    return [db.session.query(*columns)], lambda rows: _validator(rows[0])
+
+def venue_validator(venue_id):
+    return _detail_validator(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+def artist_validator(artist_id):
+    return _detail_validator(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+
+def venues_validator():
+    return _listing_validator(Venue)
+
+def artists_validator():
+    return _listing_validator(Artist)
+
+def shows_validator():
+    return _listing_validator(Show, Venue, Artist)
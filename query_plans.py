@@ -0,0 +1,106 @@
+import json
+import click
+from datetime import datetime
+from flask.cli import AppGroup
+from models import app, db
+from genres import venue_facets_query, artist_facets_query
+from queries import (venue_areas_plan, artist_list_plan, venue_timeline_plan, artist_timeline_plan,
+                     shows_page_plan, venue_validator, artist_validator, venues_validator,
+                     artists_validator, shows_validator)
+
+#----------------------------------------------------------------------------#
+# Query plans.
+#----------------------------------------------------------------------------#
+
+# `flask plans check` EXPLAINs the queries behind the listing, detail and
+# /shows pages and fails when one of them reads a whole table, or sorts
+# its rows, instead of reading them in order from an index. On PostgreSQL
+# it runs with enable_seqscan off by default, so that on small databases a
+# sequential scan still shows up only where no index can serve the query;
+# against a database with realistic volumes and fresh statistics,
+# --as-planned checks the planner's own choice instead. Run it against a
+# migrated database in CI.
+
+# The genre listings read only the genre's rows, through the association
+# table's index, and sort those.
+SORTED_SUBSETS = {'venues by genre', 'artists by genre'}
+
+def hot_queries():
+    now = datetime.now()
+    plans = {
+        'venues': venue_areas_plan(),
+        'artists': artist_list_plan(),
+        'venues by genre': venue_areas_plan('Jazz'),
+        'artists by genre': artist_list_plan('Jazz'),
+        'venue facets': ([venue_facets_query()], None),
+        'artist facets': ([artist_facets_query()], None),
+        'venue page': venue_timeline_plan(1, 10),
+        'artist page': artist_timeline_plan(1, 10),
+        'shows': shows_page_plan(),
+        'shows after cursor': shows_page_plan(after=(now, 0)),
+        'venue validator': venue_validator(1),
+        'artist validator': artist_validator(1),
+        'venues validator': venues_validator(),
+        'artists validator': artists_validator(),
+        'shows validator': shows_validator(),
+    }
+    for name, (queries, _) in plans.items():
+        for query in queries:
+            yield name, query.statement
+
+def _is_sort(problem):
+    return problem.startswith(('Sort by', 'USE TEMP B-TREE'))
+
+def _explain(statement, disable_seqscan):
+    # The full table scans and sorts in the plan of `statement`.
+    compiled = statement.compile(dialect=db.engine.dialect)
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        if disable_seqscan:
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return list(_slow_nodes(plan[0]['Plan']))
+    if db.engine.dialect.name == 'sqlite':
+        params = tuple(compiled.construct_params()[name] for name in compiled.positiontup)
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+        return [row[3] for row in rows if row[3].startswith('USE TEMP B-TREE') or
+                (row[3].startswith('SCAN ') and ' USING ' not in row[3] and row[3] != 'SCAN CONSTANT ROW')]
+    raise click.ClickException(f'No EXPLAIN support for {db.engine.dialect.name}.')
+
+def _slow_nodes(node):
+    if node['Node Type'] == 'Seq Scan':
+        yield f"Seq Scan on {node['Relation Name']}"
+    elif node['Node Type'] == 'Sort':
+        yield f"Sort by {', '.join(node['Sort Key'])}"
+    for child in node.get('Plans', ()):
+        yield from _slow_nodes(child)
+
+def slow_plans(disable_seqscan=True):
+    try:
+        return [(name, problem) for name, statement in hot_queries()
+                for problem in _explain(statement, disable_seqscan)
+                if not (name in SORTED_SUBSETS and _is_sort(problem))]
+    finally:
+        db.session.rollback()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+plans_cli = AppGroup('plans', help='Check the query plans of the hot pages.')
+
+@plans_cli.command('check')
+@click.option('--as-planned', is_flag=True,
+              help="Keep PostgreSQL's sequential scans enabled, for databases with realistic volumes.")
+def check_command(as_planned):
+    """Fail when a hot page query scans or sorts a whole table."""
+    problems = slow_plans(disable_seqscan=not as_planned)
+    for name, problem in problems:
+        click.echo(f'{name}: {problem}')
+    if problems:
+        raise click.ClickException(f'{len(problems)} full table scans or sorts')
+    click.echo('Every hot query uses an index')
+
+app.cli.add_command(plans_cli)
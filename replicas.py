@@ -0,0 +1,95 @@
+import itertools
+import threading
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from pool_metrics import pool_options
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# With SQLALCHEMY_REPLICA_URIS set, the queries of GET requests, and of
+# views marked with @reads_replica, go to the replicas in turn. Flushes,
+# DML statements and every other request stay on the primary. A request
+# that commits pins its visitor to the primary for REPLICA_STICKY_SECONDS,
+# so the page they are redirected to shows their change even while the
+# replicas catch up; meanwhile they also skip the page and fragment caches,
+# which may hold pages built from a lagging replica. Such pages are only
+# cached for REPLICA_CACHE_TTL seconds. Each request reads from a single
+# replica, picked in turn.
+
+def reads_replica(view):
+    # For POST views that only read (the search forms). Goes below
+    # @app.route.
+    view.reads_replica = True
+    return view
+
+def sticky_to_primary():
+    return session.get('primary_until', 0) > time.time()
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if self._reads_replica(clause):
+            return g.replica_engine
+        return super().get_bind(mapper, clause)
+
+    def _reads_replica(self, clause):
+        if self._flushing or not has_request_context() or not g.get('read_replica'):
+            return False
+        return not getattr(clause, 'is_dml', False)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self._replicas = None
+        self._replicas_lock = threading.Lock()
+        app.before_request(self._route_request)
+        app.after_request(self._stick_to_primary)
+
+    def replica_engine(self):
+        if self._replicas is None:
+            with self._replicas_lock:
+                if self._replicas is None:
+                    uris = self.get_app().config['SQLALCHEMY_REPLICA_URIS']
+                    self._engines = [self._create_replica(number, uri) for number, uri in enumerate(uris)]
+                    self._replicas = itertools.cycle(self._engines)
+        return next(self._replicas)
+
+    def _create_replica(self, number, uri):
+        # Same pool settings as the primary, reported in /metrics/pool as
+        # replica:<n>.
+        options = pool_options(uri, self.get_app().config['SQLALCHEMY_ENGINE_OPTIONS'], f'replica:{number}')
+        return create_engine(uri, **options)
+
+    def dispose_replicas(self, close=True):
+        # Closed engines are created again on their next use.
+        if self._replicas is not None:
+            for engine in self._engines:
+                engine.dispose(close=close)
+            if close:
+                self._replicas = None
+
+    def _route_request(self):
+        if not self.get_app().config['SQLALCHEMY_REPLICA_URIS']:
+            return
+        view = self.get_app().view_functions.get(request.endpoint)
+        reads = request.method in ('GET', 'HEAD') or getattr(view, 'reads_replica', False)
+        g.pinned_to_primary = sticky_to_primary()
+        g.read_replica = reads and not g.pinned_to_primary
+        if g.read_replica:
+            g.replica_engine = self.replica_engine()
+
+    def _stick_to_primary(self, response):
+        if g.get('committed') and self.get_app().config['SQLALCHEMY_REPLICA_URIS']:
+            session['primary_until'] = time.time() + self.get_app().config['REPLICA_STICKY_SECONDS']
+        return response
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _mark_commit(db_session):
+    if has_request_context():
+        g.committed = True
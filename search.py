@@ -0,0 +1,192 @@
+import threading
+from collections import defaultdict
+from sqlalchemy import func
+from models import app, db, Venue, Artist
+from queries import run
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# On PostgreSQL the ILIKE filters are served by the pg_trgm GIN indexes and
+# results are ranked by trigram similarity. Other databases (SQLite in local
+# runs) use an in-process n-gram index instead, so a search never scans the
+# table.
+
+def _use_trigram_indexes():
+    backend = app.config['SEARCH_BACKEND']
+    if backend == 'auto':
+        return db.engine.dialect.name == 'postgresql'
+    return backend == 'postgresql'
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+class NgramIndex:
+    def __init__(self, n=3):
+        self.n = n
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def _grams(self, text):
+        if len(text) < self.n:
+            return set()
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, doc_id, *fields):
+        fields = tuple((field or '').lower() for field in fields)
+        with self._lock:
+            self._discard(doc_id)
+            self._docs[doc_id] = fields
+            for field in fields:
+                for gram in self._grams(field):
+                    self._postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._discard(doc_id)
+
+    def _discard(self, doc_id):
+        fields = self._docs.pop(doc_id, None)
+        if fields is None:
+            return
+        for field in fields:
+            for gram in self._grams(field):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._postings[gram]
+
+    def search(self, term, limit):
+        term = term.lower()
+        with self._lock:
+            grams = self._grams(term)
+            if grams:
+                postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = self._docs.keys()
+            ranked = []
+            for doc_id in candidates:
+                score = self._score(term, self._docs[doc_id])
+                if score:
+                    ranked.append((score, doc_id))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [doc_id for _, doc_id in ranked[:limit]]
+
+    def _score(self, term, fields):
+        # Earlier fields weigh more; within a field an exact match beats a
+        # prefix match, which beats any other substring match.
+        best = 0
+        for weight, field in zip(range(len(fields), 0, -1), fields):
+            position = field.find(term)
+            if position < 0:
+                continue
+            if field == term:
+                kind = 3
+            elif position == 0:
+                kind = 2
+            else:
+                kind = 1
+            best = max(best, weight * 10 + kind + len(term) / max(len(field), 1))
+        return best
+
+    def __len__(self):
+        return len(self._docs)
+
+#  Fallback indexes
+#  ----------------------------------------------------------------
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _fallback_index(model, columns):
+    index = _indexes.get(model)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(model)
+            if index is None:
+                index = NgramIndex()
+                for row in db.session.query(model.id, *columns):
+                    index.add(row[0], *row[1:])
+                _indexes[model] = index
+    return index
+
+def _venue_index():
+    return _fallback_index(Venue, (Venue.name, Venue.city, Venue.state))
+
+def _artist_index():
+    return _fallback_index(Artist, (Artist.name,))
+
+def index_venue(venue):
+    if Venue in _indexes:
+        _indexes[Venue].add(venue.id, venue.name, venue.city, venue.state)
+
+def index_artist(artist):
+    if Artist in _indexes:
+        _indexes[Artist].add(artist.id, artist.name)
+
+def reset_indexes():
+    # Drops the fallback indexes so they are rebuilt on the next search.
+    with _indexes_lock:
+        _indexes.clear()
+
+def unindex_venue(venue_id):
+    if Venue in _indexes:
+        _indexes[Venue].remove(int(venue_id))
+
+#  Queries
+#  ----------------------------------------------------------------
+
+def _dicts(rows):
+    return [row._asdict() for row in rows]
+
+def _results_plan(model, ids):
+    query = db.session.query(model.id, model.name, model.num_upcoming_shows).filter(model.id.in_(ids))
+
+    def finish(rows):
+        by_id = {row.id: row._asdict() for row in rows}
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+    return [query], finish
+
+def venues_plan(term):
+    limit = app.config['SEARCH_RESULT_LIMIT']
+    if not _use_trigram_indexes():
+        return _results_plan(Venue, _venue_index().search(term, limit))
+
+    pattern = _like_pattern(term)
+    query = db.session.query(Venue.id, Venue.name, Venue.num_upcoming_shows).filter(
+        Venue.name.ilike(pattern, escape='\\') |
+        Venue.city.ilike(pattern, escape='\\') |
+        Venue.state.ilike(pattern, escape='\\')
+    ).order_by(
+        func.greatest(
+            func.similarity(Venue.name, term),
+            func.similarity(Venue.city, term),
+            func.similarity(Venue.state, term)
+        ).desc(),
+        Venue.name
+    ).limit(limit)
+    return [query], _dicts
+
+def venues(term):
+    return run(venues_plan(term))
+
+def artists_plan(term):
+    limit = app.config['SEARCH_RESULT_LIMIT']
+    if not _use_trigram_indexes():
+        return _results_plan(Artist, _artist_index().search(term, limit))
+
+    query = db.session.query(Artist.id, Artist.name, Artist.num_upcoming_shows).filter(
+        Artist.name.ilike(_like_pattern(term), escape='\\')
+    ).order_by(
+        func.similarity(Artist.name, term).desc(),
+        Artist.name
+    ).limit(limit)
+    return [query], _dicts
+
+def artists(term):
+    return run(artists_plan(term))
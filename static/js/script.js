@@ -2,3 +2,32 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// typeahead: fills the search box datalist from the autocomplete endpoints
+document.addEventListener('DOMContentLoaded', function() {
+  var inputs = document.querySelectorAll('input[data-autocomplete]');
+  Array.prototype.forEach.call(inputs, function(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    input.addEventListener('input', function() {
+      clearTimeout(timer);
+      var term = input.value.trim();
+      if (!term) {
+        list.innerHTML = '';
+        return;
+      }
+      timer = setTimeout(function() {
+        fetch(input.getAttribute('data-autocomplete') + '?q=' + encodeURIComponent(term))
+          .then(function(response) { return response.json(); })
+          .then(function(body) {
+            list.innerHTML = '';
+            body.data.forEach(function(item) {
+              var option = document.createElement('option');
+              option.value = item.name;
+              list.appendChild(option);
+            });
+          });
+      }, 100);
+    });
+  });
+});
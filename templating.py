@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+import time
+import click
+from flask import g, has_request_context
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache, Template, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from models import app
+from cache import page_cache
+
+#----------------------------------------------------------------------------#
+# Templates.
+#----------------------------------------------------------------------------#
+
+# Compiled templates are kept in a bytecode cache on disk, filled at build
+# time by `flask templates compile` and loaded by compile_templates() before
+# the workers fork. Outside development the templates are never checked
+# for changes (TEMPLATES_AUTO_RELOAD). Every render is timed per template for
+# /metrics/templates.
+
+class TemplateStats:
+    def __init__(self):
+        self.templates = {}
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self._lock = threading.Lock()
+
+    def record_render(self, name, seconds):
+        with self._lock:
+            stats = self.templates.setdefault(name, {"renders": 0, "total": 0.0, "max": 0.0})
+            stats["renders"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            templates = {name: {
+                "renders": stats["renders"],
+                "avg_ms": round(stats["total"] / stats["renders"] * 1000, 3),
+                "max_ms": round(stats["max"] * 1000, 3),
+                "total_ms": round(stats["total"] * 1000, 3)
+            } for name, stats in self.templates.items()}
+        return {
+            "templates": templates,
+            "fragments": {"hits": self.fragment_hits, "misses": self.fragment_misses}
+        }
+
+template_stats = TemplateStats()
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            template_stats.record_render(self.name, time.perf_counter() - start)
+
+#  Fragment cache
+#  ----------------------------------------------------------------
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'venue:' ~ venue.id, tags=[...], validator=... %}...
+    # {% endcache %} keeps the rendered block in the page cache backend. The
+    # first argument is the tag the fragment is invalidated by and, with any
+    # further arguments, its key. `tags` names the other rows the block
+    # renders, e.g. shows|cache_tags('artist', 'artist_id'), so that it is
+    # dropped when one of them changes. `validator` is any value standing
+    # for what the block renders (an updated_at, the rows themselves): the
+    # fragment is reused only while it is unchanged, which covers writes
+    # whose invalidation never reached this cache without tying the
+    # fragment to the rest of the page.
+    tags = {'cache'}
+    options = ('tags', 'validator')
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = nodes.Const(f'{parser.name}:{lineno}')
+        parts = [parser.parse_expression()]
+        options = {'tags': nodes.List([]), 'validator': nodes.Const(None)}
+        while parser.stream.skip_if('comma'):
+            current = parser.stream.current
+            if current.type == 'name' and current.value in self.options and parser.stream.look().test('assign'):
+                parser.stream.skip(2)
+                options[current.value] = parser.parse_expression()
+            else:
+                parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        arguments = [name, nodes.List(parts), options['tags'], options['validator']]
+        return nodes.CallBlock(self.call_method('_cache', arguments), [], [], body).set_lineno(lineno)
+
+    def _cache(self, name, parts, tags, validator, caller):
+        backend = page_cache.backend
+        if backend is None:
+            return caller()
+        key = f"fragment:{app.config['PAGE_VERSION']}:{name}:{':'.join(map(str, parts))}"
+        if validator is not None:
+            validator = hashlib.sha1(repr(validator).encode('utf-8')).hexdigest()
+        pinned = has_request_context() and g.get('pinned_to_primary')
+        entry = backend.get(key) if not pinned else None
+        if entry is not None and entry[0] == validator:
+            template_stats.fragment_hits += 1
+            return Markup(entry[1])
+
+        template_stats.fragment_misses += 1
+        fragment = caller()
+        tags = {str(parts[0])} | {str(tag) for tag in tags}
+        ttl = page_cache.entry_ttl()
+        if ttl > 0:
+            backend.set(key, (validator, str(fragment)), ttl, tags)
+        return fragment
+
+def cache_tags(rows, kind, attribute):
+    # The `kind:id` tags of the rows' `attribute` ids.
+    return [f'{kind}:{row[attribute]}' for row in rows]
+
+#  Environment
+#  ----------------------------------------------------------------
+
+def init_templates():
+    # Has to run before any template is loaded: the template class and the
+    # bytecode cache are picked up when a template is compiled.
+    directory = app.config['TEMPLATE_BYTECODE_CACHE']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.template_class = TimedTemplate
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.filters['cache_tags'] = cache_tags
+
+def compile_templates():
+    # Called before forking workers so that they share the compiled templates.
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
+init_templates()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+templates_cli = AppGroup('templates', help='Manage compiled templates.')
+
+@templates_cli.command('compile')
+def compile_command():
+    """Compile every template into the bytecode cache."""
+    if app.jinja_env.bytecode_cache is None:
+        raise click.ClickException('TEMPLATE_BYTECODE_CACHE is not set.')
+    compile_templates()
+    click.echo(f'{len(app.jinja_env.list_templates())} templates compiled into '
+               f"{app.config['TEMPLATE_BYTECODE_CACHE']}")
+
+app.cli.add_command(templates_cli)
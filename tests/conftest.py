@@ -0,0 +1,66 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Configuration is read when the app is imported: an in-memory database,
+# jobs run inline and no background threads.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('DEFER_BACKGROUND_JOBS', '1')
+os.environ.setdefault('JOBS_WORKERS', '0')
+os.environ.setdefault('CACHE_BACKEND', 'lru')
+os.environ.setdefault('TEMPLATE_BYTECODE_CACHE', '')
+os.environ.setdefault('IMAGES_CACHE_DIR', tempfile.mkdtemp(prefix='fyyur-images-'))
+
+import pytest
+from sqlalchemy import event
+import app as fyyur
+import search
+from cache import page_cache
+from models import db, Venue, Artist, Show
+
+@pytest.fixture
+def app():
+    fyyur.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with fyyur.app.app_context():
+        db.create_all()
+        yield fyyur.app
+        db.session.remove()
+        db.drop_all()
+    if page_cache.backend is not None:
+        page_cache.backend.clear()
+    search.reset_indexes()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+def seed(areas=3, venues_per_area=2, artists=4, shows_per_venue=2):
+    # `areas` cities with their venues and artists, and past and upcoming
+    # shows for every venue.
+    now = datetime.now()
+    artist_rows = [Artist(name=f'Artist {number}', city='New York', state='NY', genres='Jazz')
+                   for number in range(artists)]
+    venue_rows = [Venue(name=f'Venue {area}-{number}', city=f'City {area}', state='NY', genres='Jazz')
+                  for area in range(areas) for number in range(venues_per_area)]
+    db.session.add_all(artist_rows + venue_rows)
+    db.session.flush()
+    for number, venue in enumerate(venue_rows):
+        for show in range(shows_per_venue):
+            start_time = now + timedelta(days=(show - shows_per_venue // 2) * 7 + 1, hours=number)
+            db.session.add(Show(venue_id=venue.id, artist_id=artist_rows[(number + show) % artists].id,
+                                start_time=start_time))
+    db.session.commit()
+    return venue_rows, artist_rows
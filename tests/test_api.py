@@ -0,0 +1,35 @@
+from conftest import seed
+
+def test_fields_select_the_columns_returned(client):
+    venues, _ = seed(areas=1, venues_per_area=1)
+    response = client.get(f'/api/v1/venues/{venues[0].id}?fields=name,upcoming_shows_count')
+    assert response.get_json() == {"data": {"name": venues[0].name, "upcoming_shows_count": 1}}
+
+    listing = client.get('/api/v1/shows?fields=venue_name').get_json()['data']
+    assert listing and all(set(show) == {'venue_name'} for show in listing)
+
+def test_cursor_walks_every_row_once(client):
+    seed(areas=3, venues_per_area=3)
+    ids = []
+    path = '/api/v1/venues?fields=id&limit=4'
+    while path:
+        payload = client.get(path).get_json()
+        ids += [venue['id'] for venue in payload['data']]
+        path = payload['next'] and f"/api/v1/venues?fields=id&limit=4&after={payload['next']}"
+    assert ids == sorted(ids) and len(ids) == 9
+
+def test_unchanged_response_is_not_sent_again(client):
+    seed(areas=1)
+    response = client.get('/api/v1/artists')
+    revalidated = client.get('/api/v1/artists', headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+def test_bad_requests(client):
+    seed(areas=1)
+    assert client.get('/api/v1/venues?fields=name,password').status_code == 400
+    assert client.get('/api/v1/venues?after=abc').status_code == 400
+    assert client.get('/api/v1/shows?after=yesterday').status_code == 400
+    response = client.get('/api/v1/artists/999')
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Not found"}
@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from conftest import seed
+from cache import page_cache
+from models import db
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+import asgi
+
+@pytest.fixture
+def async_copy(app, tmp_path, monkeypatch):
+    # The async engine reads a file copy of the in-memory test database.
+    venues, artists = seed(areas=2, venues_per_area=2)
+    path = tmp_path / 'async.db'
+    target = sqlite3.connect(path)
+    db.session.connection().connection.driver_connection.backup(target)
+    target.close()
+    monkeypatch.setattr(asgi, 'engine', create_async_engine(f'sqlite+aiosqlite:///{path}',
+                                                             poolclass=AsyncAdaptedQueuePool))
+    return venues[0].id, artists[0].id
+
+def get_all(paths, headers=None):
+    async def fetch():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with asgi.lifespan(), httpx.AsyncClient(transport=transport, base_url='http://localhost') as http:
+            return [await http.get(path, headers=headers) for path in paths]
+    return asyncio.run(fetch())
+
+def test_pages_match_the_flask_app(client, async_copy, monkeypatch):
+    venue_id, artist_id = async_copy
+
+    async def handed_to_flask(scope, receive, send):
+        raise AssertionError(f"{scope['path']} was not served by the async pages")
+    monkeypatch.setattr(asgi, 'wsgi_application', handed_to_flask)
+    paths = ['/venues', '/artists', f'/venues/{venue_id}', f'/artists/{artist_id}', '/shows?limit=2']
+    responses = get_all(paths)
+    page_cache.backend.clear()
+    for path, response in zip(paths, responses):
+        expected = client.get(path)
+        assert response.status_code == expected.status_code == 200, path
+        assert response.content == expected.data, path
+        assert response.headers.get('ETag') == expected.headers.get('ETag'), path
+
+def test_conditional_requests_and_fallbacks(async_copy):
+    venue_id, _ = async_copy
+    etag = get_all([f'/venues/{venue_id}'])[0].headers['ETag']
+    not_modified, missing, form = get_all([f'/venues/{venue_id}', '/venues/999', '/venues/create'],
+                                          headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    # Missing rows and the other routes are left to the Flask app.
+    assert missing.status_code == 404
+    assert form.status_code == 200
+
+def test_lifespan_shutdown_disposes_the_engine(async_copy):
+    async def serve_then_shut_down():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as http:
+            await http.get('/venues')
+        pooled = asgi.engine.sync_engine.pool.checkedin()
+
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+        await asgi.application({'type': 'lifespan'}, receive, send)
+        return pooled, sent
+
+    pooled, sent = asyncio.run(serve_then_shut_down())
+    assert pooled > 0
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert asgi.engine.sync_engine.pool.checkedin() == 0
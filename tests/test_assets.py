@@ -0,0 +1,15 @@
+import assets
+
+def test_only_the_current_version_is_immutable(client):
+    version = assets.file_hash('css/main.css')
+    current = client.get(f'/static/css/main.css?v={version}')
+    assert current.headers['Cache-Control'] == assets.IMMUTABLE
+    for url in ('/static/css/main.css?v=0123456789ab', '/static/css/main.css'):
+        assert 'immutable' not in client.get(url).headers.get('Cache-Control', '')
+
+def test_main_bundle_is_self_contained(app):
+    with app.test_request_context():
+        css = assets.bundle('main.css')
+    assert '.fa-music:before' in css
+    assert f"/static/fonts/fontawesome-webfont.woff?v={assets.file_hash('fonts/fontawesome-webfont.woff')}" in css
+    assert 'url("http' not in css
@@ -0,0 +1,75 @@
+import io
+import json
+from sqlalchemy.exc import SQLAlchemyError
+import bulk_import
+from conftest import seed
+from models import Show
+
+SHOWS = '''venue_id,artist_id,start_time
+{venue},{artist},2035-05-21 21:30:00
+999,{artist},2035-05-22 21:30:00
+{venue},{artist},2035-05-23 21:30:00
+'''
+
+def test_unknown_ids_are_reported_once_when_the_batch_is_retried(app, monkeypatch):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=1, shows_per_venue=0)
+    insert_shows = bulk_import.Importer._insert_shows
+
+    def fail_batches(self, batch):
+        if len(batch) > 1:
+            raise SQLAlchemyError('batch rejected')
+        return insert_shows(self, batch)
+    monkeypatch.setattr(bulk_import.Importer, '_insert_shows', fail_batches)
+
+    shows = SHOWS.format(venue=venues[0].id, artist=artists[0].id)
+    report = bulk_import.import_catalog({'shows': (io.StringIO(shows), 'csv')})
+
+    assert report['shows']['inserted'] == 2
+    assert report['shows']['failed'] == 1
+    assert report['shows']['errors'] == [{'record': 2, 'errors': {'venue_id': ['Unknown id']}}]
+    assert Show.query.count() == 2
+
+def test_import_requires_the_token(app, client):
+    upload = lambda: {'venues': (io.BytesIO(b'name,city,state\n'), 'venues.csv')}
+    assert client.post('/import', data=upload()).status_code == 403
+
+    app.config['IMPORT_TOKEN'] = 'secret'
+    try:
+        assert client.post('/import', data=upload(), headers={'Authorization': 'Bearer wrong'}).status_code == 403
+        response = client.post('/import', data=upload(), headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+        assert response.get_json()['venues']['inserted'] == 0
+    finally:
+        app.config['IMPORT_TOKEN'] = ''
+
+def test_overlapping_shows_are_rejected(app):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=2, shows_per_venue=0)
+    shows = '''venue_id,artist_id,start_time,duration
+{venue},{first},2035-05-21 20:00:00,120
+{venue},{second},2035-05-21 21:00:00,60
+{venue},{second},2035-05-21 22:00:00,60
+'''.format(venue=venues[0].id, first=artists[0].id, second=artists[1].id)
+    report = bulk_import.import_catalog({'shows': (io.StringIO(shows), 'csv')})
+
+    assert report['shows']['inserted'] == 2
+    assert report['shows']['failed'] == 1
+    assert report['shows']['errors'][0]['record'] == 2
+    assert 'already booked' in report['shows']['errors'][0]['errors']['row'][0]
+
+def venue(name, **fields):
+    return json.dumps(dict(name=name, city='New York', state='NY', address='1 Main St', genres=['Jazz'],
+                           facebook_link='https://www.facebook.com/hall', **fields))
+
+VENUES = '\n'.join([venue('Pictured Hall', image_link='https://images.example/hall.jpg'),
+                     '["Not", "an", "object"]', '42', venue('Plain Hall')])
+
+def test_rows_that_are_not_objects_are_reported(app, monkeypatch):
+    requested = []
+    monkeypatch.setattr(bulk_import.images, 'request_thumbnail', requested.append)
+    report = bulk_import.import_catalog({'venues': (io.StringIO(VENUES), 'jsonl')})
+
+    assert report['venues']['inserted'] == 2
+    assert report['venues']['errors'] == [{'record': 2, 'errors': {'row': ['Expected a JSON object']}},
+                                          {'record': 3, 'errors': {'row': ['Expected a JSON object']}}]
+    # Imported image links get their thumbnails fetched like created ones.
+    assert requested == ['https://images.example/hall.jpg']
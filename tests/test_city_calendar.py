@@ -0,0 +1,44 @@
+from datetime import date, datetime, timedelta
+import city_calendar
+from conftest import seed
+from models import db, Venue, Artist, Show
+
+def calendar_counts(client, city):
+    response = client.get(f'/api/v1/cities/NY/{city}/calendar?days=14&fields=day,show_count')
+    assert response.status_code == 200
+    return {day['day']: day['show_count'] for day in response.get_json()['data'] if day['show_count']}
+
+def upcoming_counts(city):
+    counts = {}
+    for show in Show.query.join(Venue).filter(Venue.city == city, Show.start_time >= datetime.combine(
+            date.today(), datetime.min.time())):
+        day = show.start_time.date().isoformat()
+        counts[day] = counts.get(day, 0) + 1
+    return counts
+
+def test_calendar_holds_the_upcoming_shows_per_day(client):
+    seed(areas=2, venues_per_area=2, shows_per_venue=4)
+    assert city_calendar.refresh() is None  # the first refresh of a day is full
+    for city in ('City 0', 'City 1'):
+        assert calendar_counts(client, city) == upcoming_counts(city)
+    assert client.get('/api/v1/cities/NY/City 0/calendar?from=tomorrow').status_code == 400
+
+def test_refresh_picks_up_rows_committed_after_it_started(client):
+    venues, artists = seed(areas=2, venues_per_area=1, shows_per_venue=0)
+    an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    for model in (Venue, Artist):
+        model.query.update({'updated_at': an_hour_ago}, synchronize_session=False)
+    db.session.commit()
+    city_calendar.refresh()
+    assert city_calendar.refresh() == 0
+
+    # A transaction that was open during the last refresh commits a show
+    # stamped before that refresh started.
+    db.session.add(Show(venue_id=venues[1].id, artist_id=artists[0].id,
+                        start_time=datetime.now() + timedelta(days=2),
+                        updated_at=datetime.utcnow() - city_calendar.WATERMARK_SLACK / 2))
+    db.session.commit()
+
+    assert city_calendar.refresh() == 1
+    assert calendar_counts(client, 'City 1') == upcoming_counts('City 1') != {}
+    assert calendar_counts(client, 'City 0') == {}
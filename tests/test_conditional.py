@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from conftest import seed
+from models import db, Venue, Artist
+
+def test_cached_page_is_not_reused_for_a_newer_etag(client):
+    venues, _ = seed(areas=1, venues_per_area=1)
+    venue_id = venues[0].id
+    first = client.get(f'/venues/{venue_id}')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert client.get(f'/venues/{venue_id}').headers['X-Cache'] == 'HIT'
+
+    # A write whose invalidation never reached this cache.
+    Venue.query.filter_by(id=venue_id).update(
+        {'name': 'Renamed Hall', 'updated_at': datetime.utcnow() + timedelta(seconds=5)})
+    db.session.commit()
+
+    second = client.get(f'/venues/{venue_id}')
+    assert second.headers['X-Cache'] == 'MISS'
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert b'Renamed Hall' in second.data
+    assert client.get(f'/venues/{venue_id}', headers={'If-None-Match': second.headers['ETag']}).status_code == 304
+
+def test_etag_follows_the_shows_on_the_page(client):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=2, shows_per_venue=2)
+    venue_id, artist_id = venues[0].id, artists[1].id
+    etags = [client.get(f'/venues/{venue_id}').headers['ETag']]
+
+    # A past show and a renamed artist from the page each change it.
+    client.post('/shows/create', data=dict(venue_id=venue_id, artist_id=artist_id,
+                                           start_time='2001-05-21 21:30:00'))
+    etags.append(client.get(f'/venues/{venue_id}').headers['ETag'])
+    Artist.query.filter_by(id=artist_id).update(
+        {'name': 'Renamed Band', 'updated_at': datetime.utcnow() + timedelta(seconds=5)})
+    db.session.commit()
+    etags.append(client.get(f'/venues/{venue_id}').headers['ETag'])
+    assert len(set(etags)) == 3
+
+def test_venue_without_genres_is_shown(client):
+    db.session.add(Venue(name='Quiet Hall', city='New York', state='NY'))
+    db.session.commit()
+    assert client.get(f'/venues/{Venue.query.one().id}').status_code == 200
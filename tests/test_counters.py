@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+import counters
+from conftest import seed
+from models import db, Venue, Artist, Show
+
+def upcoming(model, now):
+    # {id: counter} and {id: upcoming shows counted from the Show table}.
+    owner_column = Show.venue_id if model is Venue else Show.artist_id
+    db.session.expire_all()
+    maintained = {row.id: row.num_upcoming_shows for row in model.query}
+    counted = dict.fromkeys(maintained, 0)
+    counted.update(db.session.query(owner_column, db.func.count(Show.id))
+                   .filter(Show.start_time > now).group_by(owner_column))
+    return maintained, counted
+
+def test_rebuild_matches_a_fresh_count(app):
+    seed(areas=2, venues_per_area=2, artists=3, shows_per_venue=4)
+    now = datetime.now()
+    counters.rebuild(now)
+    for model in (Venue, Artist):
+        maintained, counted = upcoming(model, now)
+        assert maintained == counted
+        assert any(counted.values())
+
+def test_created_show_is_counted(client):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=1, shows_per_venue=0)
+    venue_id, artist_id = venues[0].id, artists[0].id
+    counters.rebuild()
+    response = client.post('/shows/create', data=dict(
+        venue_id=venue_id, artist_id=artist_id, start_time='2035-05-21 21:30:00'))
+    assert b'Show was successfully listed' in response.data
+    assert db.session.get(Venue, venue_id).num_upcoming_shows == 1
+    assert db.session.get(Artist, artist_id).num_upcoming_shows == 1
+
+def test_deleted_venue_is_subtracted_from_its_artists(client):
+    venues, artists = seed(areas=1, venues_per_area=2, artists=1, shows_per_venue=2)
+    venue_id, artist_id = venues[0].id, artists[0].id
+    counters.rebuild()
+    assert db.session.get(Artist, artist_id).num_upcoming_shows == 2
+
+    client.delete(f'/venues/{venue_id}')
+    maintained, counted = upcoming(Artist, datetime.now())
+    assert maintained == counted == {artist_id: 1}
+
+def test_roll_forward_subtracts_shows_that_started(app):
+    seed(areas=1, venues_per_area=2, artists=2, shows_per_venue=4)
+    now = datetime.now()
+    counters.rebuild(now)
+
+    later = now + timedelta(days=3)
+    assert counters.roll_forward(later) == Show.query.filter(Show.start_time > now,
+                                                             Show.start_time <= later).count() > 0
+    for model in (Venue, Artist):
+        maintained, counted = upcoming(model, later)
+        assert maintained == counted
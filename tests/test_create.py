@@ -0,0 +1,16 @@
+from jobs import job_queue
+
+VENUE = {'name': 'Fresh Hall', 'city': 'New York', 'state': 'NY', 'address': '1 Main St', 'phone': '1',
+         'genres': ['Jazz'], 'facebook_link': '', 'image_link': '', 'website_link': '',
+         'seeking_talent': '', 'seeking_description': ''}
+
+def test_created_venue_is_listed_and_searchable_right_away(client, monkeypatch):
+    assert b'Fresh Hall' not in client.get('/venues').data
+    assert b'Fresh Hall' not in client.post('/venues/search', data={'search_term': 'fresh'}).data
+    # Nothing the next request depends on may be left to a job, which
+    # another process could claim.
+    monkeypatch.setattr(job_queue, 'enqueue', lambda name, *args: None)
+    client.post('/venues/create', data=VENUE)
+
+    assert b'Fresh Hall' in client.get('/venues').data
+    assert b'Fresh Hall' in client.post('/venues/search', data={'search_term': 'fresh'}).data
@@ -0,0 +1,38 @@
+import io
+from datetime import datetime, timedelta
+import export
+from conftest import seed
+from models import db, Venue
+
+def exported_ids(kind, since=None):
+    table = export.Export(kind, since=since)
+    rows = export.read_columnar(io.BytesIO(b''.join(table.write('fyc', 2))))
+    return [row['id'] for row in rows], table.watermark
+
+def test_columnar_export_reads_back(app):
+    venues, _ = seed(areas=2, venues_per_area=2)
+    rows = list(export.read_columnar(io.BytesIO(b''.join(export.Export('venues').write('fyc', 3)))))
+
+    assert [row['id'] for row in rows] == [venue.id for venue in venues]
+    assert rows[0]['name'] == venues[0].name
+    assert rows[0]['seeking_talent'] is False
+    assert datetime.fromisoformat(rows[0]['updated_at']) == venues[0].updated_at
+
+def test_incremental_export_repeats_the_slack_interval(app):
+    venues, _ = seed(areas=1, venues_per_area=3)
+    old = datetime.utcnow() - timedelta(hours=1)
+    Venue.query.filter(Venue.id != venues[2].id).update({'updated_at': old}, synchronize_session=False)
+    db.session.commit()
+
+    ids, watermark = exported_ids('venues')
+    assert sorted(ids) == [venue.id for venue in venues]
+    assert watermark < venues[2].updated_at
+
+    # A transaction that was still open commits a row stamped before the
+    # last export finished.
+    Venue.query.filter_by(id=venues[0].id).update(
+        {'updated_at': watermark + timedelta(seconds=1)}, synchronize_session=False)
+    db.session.commit()
+
+    ids, _ = exported_ids('venues', since=watermark)
+    assert sorted(ids) == [venues[0].id, venues[2].id]
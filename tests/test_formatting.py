@@ -0,0 +1,10 @@
+from datetime import datetime
+from models import format_datetime, format_datetimes
+
+def test_batch_matches_single_values():
+    values = [datetime(2026, 5, 1, 20), datetime(2026, 5, 2, 21, 30), datetime(2026, 5, 1, 20)]
+    assert format_datetimes(values, 'full') == [format_datetime(value, 'full') for value in values]
+    assert format_datetimes(values, 'full')[0] == 'Friday May, 1, 2026 at 8:00PM'
+
+def test_strings_are_still_accepted():
+    assert format_datetime('2026-05-01 20:00:00') == format_datetime(datetime(2026, 5, 1, 20))
@@ -0,0 +1,41 @@
+from conftest import seed
+from cache import page_cache
+from templating import template_stats
+from models import db
+
+def get_with_flash(client, path):
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Saved')]
+    return client.get(path)
+
+def test_show_grid_fragment_is_dropped_with_its_artists(client):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=1, shows_per_venue=2)
+    path = f'/venues/{venues[0].id}'
+    assert b'Artist 0' in get_with_flash(client, path).data
+
+    # Pages carrying flashes skip the page cache and the ETag, so only the
+    # fragment's own tags can drop it.
+    artists[0].name = 'Renamed Band'
+    db.session.commit()
+    page_cache.invalidate(f'artist:{artists[0].id}')
+
+    response = get_with_flash(client, path)
+    assert b'Renamed Band' in response.data
+    assert b'Artist 0' not in response.data
+
+def test_unchanged_fragment_is_reused_after_an_unrelated_change(client):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=1, shows_per_venue=2)
+    path = f'/venues/{venues[0].id}'
+    client.get(path)
+
+    # The artist edit changes the page's ETag and drops the cached page and
+    # the show grid, but not the venue header.
+    artists[0].name = 'Renamed Band'
+    db.session.commit()
+    page_cache.invalidate(f'artist:{artists[0].id}')
+
+    hits = template_stats.fragment_hits
+    response = client.get(path)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert b'Renamed Band' in response.data
+    assert template_stats.fragment_hits == hits + 1
@@ -0,0 +1,43 @@
+from models import db, Genre, Venue
+import genres
+
+def count(name, column='venue_count'):
+    return db.session.query(getattr(Genre, column)).filter(Genre.name == name).scalar()
+
+def test_counts_follow_genre_changes(app):
+    venue = Venue(name='Hall', city='Austin', state='TX')
+    db.session.add(venue)
+    genres.set_venue_genres(venue, ['Jazz', 'Blues'])
+    db.session.commit()
+    genres.set_venue_genres(venue, ['Jazz', 'Folk'])
+    db.session.commit()
+    assert (count('Jazz'), count('Blues'), count('Folk')) == (1, 0, 1)
+
+def test_counts_are_incremented_in_sql(app):
+    venue = Venue(name='Hall', city='Austin', state='TX')
+    db.session.add(venue)
+    genres.set_venue_genres(venue, ['Jazz'])
+    db.session.commit()
+    Genre.query.filter_by(name='Jazz').one()
+    # Another process links five more venues meanwhile.
+    db.session.execute(Genre.__table__.update().values(venue_count=Genre.venue_count + 5))
+    other = Venue(name='Club', city='Austin', state='TX')
+    db.session.add(other)
+    genres.set_venue_genres(other, ['Jazz'])
+    db.session.commit()
+    assert count('Jazz') == 7
+
+def test_genre_created_concurrently_is_reused(app):
+    genres._insert_missing(['Jazz'])
+    genres._insert_missing(['Jazz', 'Soul'])
+    db.session.commit()
+    assert sorted(name for name, in db.session.query(Genre.name)) == ['Jazz', 'Soul']
+
+def test_bulk_links_add_to_counts(app):
+    venues = [Venue(name=f'Venue {number}', city='Austin', state='TX') for number in range(3)]
+    db.session.add_all(venues)
+    db.session.flush()
+    genres.link_venues([(venue.id, 'Jazz,Rock') for venue in venues])
+    genres.link_venues([(venues[0].id, ['Soul'])])
+    db.session.commit()
+    assert (count('Jazz'), count('Rock'), count('Soul')) == (3, 3, 1)
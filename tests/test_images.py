@@ -0,0 +1,121 @@
+import io
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import images
+from models import db, Venue
+
+def png():
+    output = io.BytesIO()
+    Image.new('RGB', (640, 480), (200, 40, 40)).save(output, 'PNG')
+    return output.getvalue()
+
+@pytest.fixture
+def image_server():
+    # Local stand-in for the hosts image_links point at.
+    hosts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hosts.append(self.headers['Host'])
+            if self.path == '/photo.png':
+                body, content_type = png(), 'image/png'
+            elif self.path == '/page.html':
+                body, content_type = b'<html></html>', 'text/html'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1], hosts
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def allow_private(app):
+    app.config['IMAGES_ALLOW_PRIVATE'] = True
+    yield
+    app.config['IMAGES_ALLOW_PRIVATE'] = False
+
+def add_venue(link):
+    venue = Venue(name='Pictured Hall', city='New York', state='NY', genres='Jazz', image_link=link)
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+def test_thumbnail_is_fetched_and_served(client, image_server, allow_private):
+    port, _ = image_server
+    link = f'http://127.0.0.1:{port}/photo.png'
+    venue = add_venue(link)
+    images.refresh_thumbnail(link)
+
+    with client.application.test_request_context():
+        url = images.thumbnail_url('venues', venue.id, link)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.headers['Cache-Control'] == images.IMMUTABLE
+    assert Image.open(io.BytesIO(response.data)).size == \
+        tuple(int(side) for side in client.application.config['IMAGES_THUMBNAIL_SIZE'].split('x'))
+
+def test_non_images_are_refused(app, image_server, allow_private):
+    port, _ = image_server
+    with pytest.raises(images.ImageError):
+        images.fetch(f'http://127.0.0.1:{port}/page.html')
+
+def test_private_addresses_are_refused(app, image_server):
+    port, hosts = image_server
+    with pytest.raises(images.ImageError):
+        images.fetch(f'http://127.0.0.1:{port}/photo.png')
+    assert hosts == []
+
+def test_connection_goes_to_the_checked_address(app, image_server, monkeypatch):
+    # Once checked, the host name is not looked up again, so it cannot be
+    # re-pointed at another address before the connection is made.
+    port, hosts = image_server
+    checked = []
+
+    def public_address(host, port):
+        checked.append(host)
+        return '127.0.0.1'
+    monkeypatch.setattr(images, 'public_address', public_address)
+
+    assert images.fetch(f'http://images.example:{port}/photo.png')[:4] == b'\x89PNG'
+    assert checked == ['images.example', 'images.example']
+    assert hosts == [f'images.example:{port}']
+
+def test_https_links_are_checked_on_port_443(app, monkeypatch):
+    ports = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        ports.append(port)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', port))]
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+
+    images.check_url('https://images.example/photo.png')
+    images.check_url('http://images.example/photo.png')
+    assert ports == [443, 80]
+
+def test_thumbnail_of_another_link_is_not_served(client, image_server, allow_private):
+    port, _ = image_server
+    other = f'http://127.0.0.1:{port}/photo.png'
+    images.refresh_thumbnail(other)
+    venue = add_venue(f'http://127.0.0.1:{port}/missing.png')
+
+    response = client.get(f'/images/venues/{venue.id}.jpg?v={images.link_key(other)}')
+    assert response.status_code == 302
+    assert images.link_key(venue.image_link) in response.headers['Location']
@@ -0,0 +1,33 @@
+from datetime import datetime
+from conftest import seed
+from models import db, Venue, Show
+from queries import decode_show_cursor, entity_page, shows_page
+
+def test_show_pages_split_equal_start_times(app):
+    venues, artists = seed(areas=1, venues_per_area=2, artists=2, shows_per_venue=0)
+    same_time = datetime(2035, 5, 21, 21, 30)
+    for number in range(7):
+        db.session.add(Show(venue_id=venues[number % 2].id, artist_id=artists[0].id,
+                            start_time=same_time if number < 5 else datetime(2035, 6, number)))
+    db.session.commit()
+
+    pages = []
+    after = None
+    while True:
+        rows, next_cursor = shows_page(after, limit=2, fields=('id',))
+        pages.append([row['id'] for row in rows])
+        if next_cursor is None:
+            break
+        after = decode_show_cursor(next_cursor)
+
+    expected = [show.id for show in Show.query.order_by(Show.start_time, Show.id)]
+    assert pages == [expected[0:2], expected[2:4], expected[4:6], expected[6:7]]
+
+def test_last_full_page_has_no_cursor(app):
+    seed(areas=2, venues_per_area=2, shows_per_venue=0)
+    rows, next_cursor = entity_page(Venue, ['name'], limit=2)
+    assert next_cursor == str(rows[-1]['id'])
+    rows, next_cursor = entity_page(Venue, ['name'], after=int(next_cursor), limit=2)
+    assert len(rows) == 2
+    assert next_cursor is None
+    assert entity_page(Venue, ['name'], after=rows[-1]['id'], limit=2) == ([], None)
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from conftest import seed
+from models import db
+from profiler import profiler
+
+def test_query_budget_counts_request_statements(client):
+    seed(areas=2)
+    client.get('/venues')
+    with profiler.query_budget(10) as profile:
+        client.get('/venues?genre=Jazz')
+    assert 0 < profile.count <= 10
+
+    with pytest.raises(AssertionError, match='exceed the budget of 1'):
+        with profiler.query_budget(1):
+            client.get('/artists?genre=Rock')
+
+def test_failed_statements_leave_no_start_time_behind(app):
+    with profiler.query_budget(5) as profile:
+        connection = db.session.connection()
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM missing_table')
+            db.session.rollback()
+            connection = db.session.connection()
+        connection.exec_driver_sql('SELECT 1')
+    assert profile.count == 1
+    assert not connection.info['profiler_started']
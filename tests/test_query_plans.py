@@ -0,0 +1,20 @@
+import pytest
+from benchmarks.common import seed
+from models import db
+import query_plans
+
+@pytest.fixture
+def large_catalog(app):
+    # Enough rows, with fresh statistics, for the planner to prefer a full
+    # scan wherever no index serves a query.
+    seed(venues=5000, artists=5000, shows=50000)
+    db.session.connection().exec_driver_sql('ANALYZE')
+    db.session.commit()
+
+def test_hot_queries_use_indexes(large_catalog):
+    assert query_plans.slow_plans(disable_seqscan=False) == []
+
+def test_a_missing_index_is_reported(large_catalog):
+    db.session.connection().exec_driver_sql('DROP INDEX "ix_Show_start_time_id"')
+    db.session.commit()
+    assert 'shows' in {name for name, _ in query_plans.slow_plans(disable_seqscan=False)}
@@ -0,0 +1,49 @@
+import time
+import pytest
+from sqlalchemy import create_engine
+from models import db, Artist
+
+EDIT = {'name': 'Edited Band', 'city': 'New York', 'state': 'NY', 'phone': '555-0100', 'genres': ['Jazz'],
+        'facebook_link': '', 'website_link': '', 'image_link': '', 'seeking_venue': '',
+        'seeking_description': ''}
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    # A second SQLite file standing in for a replica that lags behind: it
+    # has the same artist under an older name.
+    artist = Artist(name='Primary Band', city='New York', state='NY', genres='Jazz')
+    db.session.add(artist)
+    db.session.commit()
+    uri = f'sqlite:///{tmp_path / "replica.db"}'
+    engine = create_engine(uri)
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Artist.__table__.insert(), {
+            'id': artist.id, 'name': 'Replica Band', 'city': 'New York', 'state': 'NY', 'genres': 'Jazz',
+            'updated_at': artist.updated_at})
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_REPLICA_URIS', [uri])
+    yield artist.id
+    db.dispose_replicas()
+    engine.dispose()
+
+def test_reads_go_to_the_replica(client, replica):
+    response = client.get(f'/artists/{replica}')
+    assert b'Replica Band' in response.data
+    assert b'Primary Band' not in response.data
+
+def test_visitor_reads_the_primary_after_a_write(app, client, replica):
+    assert client.post(f'/artists/{replica}/edit', data=EDIT).status_code == 302
+    assert b'Edited Band' in client.get(f'/artists/{replica}').data
+
+    # Other visitors still read the replica.
+    assert b'Replica Band' in app.test_client().get(f'/artists/{replica}').data
+
+def test_replica_pages_are_cached_briefly(app, client, replica, monkeypatch):
+    path = f'/artists/{replica}'
+    assert client.get(path).headers['X-Cache'] == 'MISS'
+    assert client.get(path).headers['X-Cache'] == 'HIT'
+
+    later = time.time() + app.config['REPLICA_CACHE_TTL'] + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert app.config['REPLICA_CACHE_TTL'] < app.config['CACHE_TTL']
+    assert client.get(path).headers['X-Cache'] == 'MISS'
@@ -0,0 +1,45 @@
+import search
+from conftest import seed
+from models import db, Venue
+
+def test_trigrams_match_substrings_ranked_by_field_and_position():
+    index = search.NgramIndex()
+    index.add(1, 'The Dueling Pianos Bar', 'New York', 'NY')
+    index.add(2, 'Park Square Live Music & Coffee', 'San Francisco', 'CA')
+    index.add(3, 'Musical Hop', 'San Francisco', 'CA')
+    index.add(4, 'Music', 'Boston', 'MA')
+
+    assert index.search('music', 10) == [4, 3, 2]
+    assert index.search('FRANCISCO', 10) == [2, 3]
+    assert index.search('pianist', 10) == []
+
+def test_short_terms_match_any_substring():
+    index = search.NgramIndex()
+    index.add(1, 'Guns N Petals')
+    index.add(2, 'Matt Quevedo')
+    index.add(3, 'N')
+
+    assert index.search('n', 10) == [3, 1]
+    assert index.search('ev', 10) == [2]
+    assert index.search('', 2) == [1, 2]
+
+def test_removed_documents_are_not_found():
+    index = search.NgramIndex()
+    index.add(1, 'Hop Hall')
+    index.add(2, 'Hop Club')
+    index.remove(1)
+    index.add(2, 'Jazz Club')
+    assert index.search('hop', 10) == []
+    assert len(index) == 1
+
+def test_sqlite_search_uses_the_ngram_index(client):
+    seed(areas=2, venues_per_area=2)
+    response = client.post('/venues/search', data={'search_term': 'venue 1-'})
+    assert b'Venue 1-0' in response.data and b'Venue 1-1' in response.data
+    assert b'Venue 0-0' not in response.data
+
+    # Venues created afterwards are added to the built index.
+    db.session.add(Venue(name='Venue 1-9', city='City 1', state='NY', genres='Jazz'))
+    db.session.commit()
+    search.index_venue(Venue.query.filter_by(name='Venue 1-9').one())
+    assert [venue['name'] for venue in search.venues('1-9')] == ['Venue 1-9']
@@ -0,0 +1,16 @@
+from conftest import seed
+from models import Show
+
+def create_show(client, venue, artist, **fields):
+    return client.post('/shows/create', data=dict(
+        venue_id=venue.id, artist_id=artist.id, start_time='2035-05-21 21:30:00', **fields))
+
+def test_show_duration_must_be_positive(client):
+    venues, artists = seed(areas=1, venues_per_area=1, artists=1, shows_per_venue=0)
+    for duration in ('0', '-30', 'two hours'):
+        response = create_show(client, venues[0], artists[0], duration=duration)
+        assert b'Show could not be listed' in response.data
+    assert Show.query.count() == 0
+
+    create_show(client, venues[0], artists[0], duration='90')
+    assert [show.duration for show in Show.query] == [90]
@@ -0,0 +1,27 @@
+import typeahead
+from conftest import seed
+
+def names(response):
+    return [entry['name'] for entry in response.get_json()['data']]
+
+def test_prefix_lookup_and_removal_after_delete(client):
+    venues, _ = seed(areas=2, venues_per_area=2)
+    typeahead.rebuild()
+    venue_id = venues[2].id
+
+    assert names(client.get('/venues/autocomplete?q=venue 1')) == ['Venue 1-0', 'Venue 1-1']
+    # Every word of a name starts a key.
+    assert names(client.get('/venues/autocomplete?q=1-')) == ['Venue 1-0', 'Venue 1-1']
+    assert names(client.get('/venues/autocomplete?q=venue&limit=1')) == ['Venue 0-0']
+
+    client.delete(f'/venues/{venue_id}')
+    assert names(client.get('/venues/autocomplete?q=venue 1')) == ['Venue 1-1']
+
+def test_new_artist_is_found_by_prefix(client):
+    seed(areas=1)
+    typeahead.rebuild()
+    client.post('/artists/create', data={
+        'name': 'Zydeco Kings', 'city': 'New Orleans', 'state': 'LA', 'phone': '555-0100', 'genres': ['Jazz'],
+        'image_link': '', 'facebook_link': '', 'website_link': '', 'seeking_venue': '',
+        'seeking_description': ''})
+    assert names(client.get('/artists/autocomplete?q=kin')) == ['Zydeco Kings']
@@ -0,0 +1,23 @@
+from conftest import count_queries, seed
+from cache import page_cache
+from queries import run, venue_areas_plan
+
+def test_areas_are_grouped_in_order(app):
+    seed(areas=3, venues_per_area=2)
+    areas = run(venue_areas_plan())
+    assert [(area['city'], area['state']) for area in areas] == [('City 0', 'NY'), ('City 1', 'NY'), ('City 2', 'NY')]
+    assert [venue['name'] for venue in areas[1]['venues']] == ['Venue 1-0', 'Venue 1-1']
+
+def listing_queries(client):
+    page_cache.backend.clear()
+    with count_queries() as statements:
+        response = client.get('/venues')
+    assert response.status_code == 200
+    return len(statements)
+
+def test_listing_query_count_does_not_grow_with_areas(app, client):
+    client.get('/')  # warms the typeahead indexes
+    seed(areas=2)
+    few = listing_queries(client)
+    seed(areas=50)
+    assert listing_queries(client) == few
@@ -0,0 +1,157 @@
+import threading
+import time
+from bisect import bisect_left, insort
+import click
+from flask.cli import AppGroup
+from models import app, db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Typeahead.
+#----------------------------------------------------------------------------#
+
+# Venue and artist names are kept in memory as a sorted list of
+# (lowercased key, id) pairs, with one key per word of the name, so a prefix
+# lookup is a bisect followed by a short forward scan. Each index holds at
+# most TYPEAHEAD_MAX_ENTRIES names; when it is full the name with the fewest
+# upcoming shows is dropped.
+
+MAX_WORDS = 4
+MAX_KEY_LENGTH = 64
+
+class PrefixIndex:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._keys = []
+        self._names = {}
+        self._weights = {}
+        self._lock = threading.RLock()
+
+    def _keys_for(self, name):
+        words = name.lower().split()[:MAX_WORDS]
+        return {' '.join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words))}
+
+    def add(self, entry_id, name, weight=0):
+        with self._lock:
+            self._discard(entry_id)
+            if not name:
+                return
+            if len(self._names) >= self.max_entries:
+                lightest = min(self._weights, key=self._weights.get)
+                if self._weights[lightest] > weight:
+                    return
+                self._discard(lightest)
+            self._names[entry_id] = name
+            self._weights[entry_id] = weight or 0
+            for key in self._keys_for(name):
+                insort(self._keys, (key, entry_id))
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._discard(entry_id)
+
+    def _discard(self, entry_id):
+        name = self._names.pop(entry_id, None)
+        if name is None:
+            return
+        del self._weights[entry_id]
+        for key in self._keys_for(name):
+            position = bisect_left(self._keys, (key, entry_id))
+            if position < len(self._keys) and self._keys[position] == (key, entry_id):
+                del self._keys[position]
+
+    def load(self, rows):
+        # Swap in a freshly built index in one step so lookups never see a
+        # half-built list.
+        fresh = PrefixIndex(self.max_entries)
+        rows = sorted(rows, key=lambda row: -(row[2] or 0))[:self.max_entries]
+        for entry_id, name, weight in rows:
+            fresh._names[entry_id] = name
+            fresh._weights[entry_id] = weight or 0
+            fresh._keys.extend((key, entry_id) for key in fresh._keys_for(name or ''))
+        fresh._keys.sort()
+        with self._lock:
+            self._keys, self._names, self._weights = fresh._keys, fresh._names, fresh._weights
+
+    def search(self, prefix, limit):
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._keys, (prefix,))
+            while position < len(self._keys) and len(results) < limit:
+                key, entry_id = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    results.append({"id": entry_id, "name": self._names[entry_id]})
+                position += 1
+        return results
+
+    def __len__(self):
+        return len(self._names)
+
+venue_index = PrefixIndex(app.config['TYPEAHEAD_MAX_ENTRIES'])
+artist_index = PrefixIndex(app.config['TYPEAHEAD_MAX_ENTRIES'])
+_warm = threading.Event()
+
+def rebuild():
+    venue_index.load(db.session.query(Venue.id, Venue.name, Venue.num_upcoming_shows).all())
+    artist_index.load(db.session.query(Artist.id, Artist.name, Artist.num_upcoming_shows).all())
+    _warm.set()
+
+def warmup():
+    if not _warm.is_set():
+        rebuild()
+
+def refresh():
+    # Rebuilds indexes that are already in use, e.g. after a bulk import.
+    if _warm.is_set():
+        rebuild()
+
+def index_venue(venue):
+    if _warm.is_set():
+        venue_index.add(venue.id, venue.name, venue.num_upcoming_shows)
+
+def index_artist(artist):
+    if _warm.is_set():
+        artist_index.add(artist.id, artist.name, artist.num_upcoming_shows)
+
+def unindex_venue(venue_id):
+    venue_index.remove(int(venue_id))
+
+def start_rebuild(interval):
+    # Picks up names written by other processes, which the incremental
+    # updates of this process do not see.
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    rebuild()
+                except Exception:
+                    app.logger.exception('Rebuilding the typeahead indexes failed')
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='typeahead-rebuild', daemon=True)
+    thread.start()
+    return thread
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+typeahead_cli = AppGroup('typeahead', help='Inspect the typeahead indexes.')
+
+@typeahead_cli.command('rebuild')
+def rebuild_command():
+    """Build both indexes and report their size and build time."""
+    started = time.perf_counter()
+    rebuild()
+    elapsed = time.perf_counter() - started
+    click.echo(f'{len(venue_index)} venues and {len(artist_index)} artists indexed in {elapsed:.3f}s')
+
+app.cli.add_command(typeahead_cli)
@@ -0,0 +1,11 @@
+from app import app
+from templating import compile_templates
+
+#----------------------------------------------------------------------------#
+# WSGI entry point.
+#----------------------------------------------------------------------------#
+
+# `gunicorn wsgi:app` (settings in gunicorn.conf.py). With preload_app the
+# master imports this module once and the workers are forked from it.
+
+compile_templates()